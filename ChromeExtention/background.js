@@ -206,16 +206,24 @@ function syncPendingPages() {
   });
 }
 
+// Gzip a string body; page HTML typically shrinks ~10x
+function gzipBody(text) {
+  const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'));
+  return new Response(stream).arrayBuffer();
+}
+
 // Send data to backend API (with callback for backendId)
 function sendDataToBackend(data, onSuccess) {
-  console.log('[ResearchBoard] Sending to backend:', data);
-  fetch('http://127.0.0.1:8000/api/v1/collect', {
+  console.log('[ResearchBoard] Sending to backend:', data.url);
+  gzipBody(JSON.stringify(data))
+  .then(body => fetch('http://127.0.0.1:8000/api/v1/collect', {
     method: 'POST',
     headers: {
-      'Content-Type': 'application/json'
+      'Content-Type': 'application/json',
+      'Content-Encoding': 'gzip'
     },
-    body: JSON.stringify(data)
-  })
+    body
+  }))
   .then(response => response.json())
   .then(result => {
     console.log('[ResearchBoard] Backend response:', result);
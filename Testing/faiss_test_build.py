@@ -4,12 +4,24 @@ import faiss
 import os
 
 DB_PATH = os.path.join("data", "app.db")
-FAISS_INDEX_PATH = os.path.join("data", "faiss_index.bin")
+FAISS_INDEX_PATH = os.path.join("data", "faiss_index_ip.bin")  # "_ip": vectors are L2-normalized
 DIMENSION = 768  # Make sure this matches your model's dimension
 
-def bytes_to_float_list(binary_data: bytes) -> list[float]:
-    """Converts a binary blob of float32 back to a list of floats."""
-    return np.frombuffer(binary_data, dtype=np.float32)
+def decode_embedding(blob: bytes, dtype: str) -> np.ndarray:
+    """Decodes one stored embedding ('f32', 'f16', or 'sq8' = float32 scale + int8 codes)."""
+    if dtype == "sq8":
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float32) * scale
+    if dtype == "f16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    return np.frombuffer(blob, dtype=np.float32)
+
+def blobs_to_matrix(rows) -> np.ndarray:
+    """Decodes (embedding, dtype) rows into one contiguous (N, DIMENSION) float32 matrix."""
+    rows = list(rows)
+    if all(dtype == "f32" for _, dtype in rows):
+        return np.frombuffer(b"".join(blob for blob, _ in rows), dtype=np.float32).reshape(-1, DIMENSION).copy()
+    return np.stack([decode_embedding(blob, dtype) for blob, dtype in rows])
 
 def run_faiss_build_test():
     """Builds and tests the FAISS index directly from the database."""
@@ -24,7 +36,7 @@ def run_faiss_build_test():
         cursor = conn.cursor()
         
         print("Fetching all embeddings from the database...")
-        cursor.execute("SELECT id, page_id, embedding FROM embeddings")
+        cursor.execute("SELECT id, page_id, embedding, embedding_dtype FROM embeddings")
         results = cursor.fetchall()
         
         if not results:
@@ -34,11 +46,13 @@ def run_faiss_build_test():
         print(f"Found {len(results)} embeddings to index.")
         
         # We'll map the FAISS index position to the original page_id
-        index_to_page_id = {i: page_id for i, (_, page_id, _) in enumerate(results)}
-        all_vectors = np.array([bytes_to_float_list(embedding) for _, _, embedding in results]).astype('float32')
+        index_to_page_id = np.array([page_id for _, page_id, _, _ in results], dtype=np.int64)
+        all_vectors = blobs_to_matrix((embedding, dtype) for _, _, embedding, dtype in results)
 
         # Build the FAISS index
-        index = faiss.IndexFlatL2(DIMENSION)
+        # Cosine similarity == inner product of L2-normalized vectors
+        faiss.normalize_L2(all_vectors)
+        index = faiss.IndexFlatIP(DIMENSION)
         index.add(all_vectors)
         print(f"✅ FAISS index built successfully with {index.ntotal} vectors.")
         
@@ -55,9 +69,9 @@ def run_faiss_build_test():
         
         print("Search completed. Top 3 results:")
         for i, idx in enumerate(indices[0]):
-            page_id = index_to_page_id[idx]
-            distance = distances[0][i]
-            print(f"  {i+1}. Page ID: {page_id}, Distance: {distance:.4f}")
+            page_id = int(index_to_page_id[idx])
+            similarity = distances[0][i]
+            print(f"  {i+1}. Page ID: {page_id}, Similarity: {similarity:.4f}")
             
         print("\n--- Verification ---")
         if indices[0][0] == 0:
@@ -0,0 +1,43 @@
+import time
+import httpx
+
+API_COLLECT_URL = "http://127.0.0.1:8000/api/v1/collect"
+
+def run_empty_text_dedup_test():
+    """Regression test: two unrelated pages with no extractable text must not be merged by content hash."""
+    print("\n--- Testing /collect Dedup With Empty Extracted Text ---")
+
+    # Unique URLs so the test can be re-run against the same database
+    stamp = int(time.time() * 1000)
+    payloads = [
+        {"url": f"https://a.example.com/{stamp}", "title": "Image only", "html": "<html><body><img src='a.png'></body></html>"},
+        {"url": f"https://b.example.com/{stamp}", "title": "Canvas only", "html": "<html><body><canvas></canvas></body></html>"},
+    ]
+
+    try:
+        responses = []
+        for payload in payloads:
+            print(f"Collecting {payload['url']}")
+            response = httpx.post(API_COLLECT_URL, json=payload, timeout=60.0)
+            response.raise_for_status()
+            responses.append(response.json())
+
+        first, second = responses
+        print(f"First:  {first}")
+        print(f"Second: {second}")
+
+        print("\n--- Verification ---")
+        if second.get("duplicate") or second.get("page_id") == first.get("page_id"):
+            print("❌ FAILED: the second page was treated as a duplicate of the first.")
+        else:
+            print("Test PASSED: both pages were stored separately.")
+
+    except httpx.HTTPStatusError as e:
+        print(f"❌ FAILED: API returned an error: {e.response.status_code}")
+        print(f"Response body: {e.response.text}")
+    except httpx.RequestError as e:
+        print(f"❌ FAILED: Error calling the collect API: {e}")
+        print("--- Is your FastAPI server running? ---")
+
+if __name__ == "__main__":
+    run_empty_text_dedup_test()
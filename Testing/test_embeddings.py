@@ -1,13 +1,14 @@
+import asyncio
 import httpx
 import numpy as np
 
 OLLAMA_EMBED_URL = "http://127.0.0.1:11434/api/embeddings"
 MODEL_NAME = "embeddinggemma:latest"
 
-def get_embedding(text: str) -> np.ndarray:
+async def get_embedding(client: httpx.AsyncClient, text: str) -> np.ndarray:
     """Gets an embedding from Ollama and returns it as a numpy array."""
     try:
-        response = httpx.post(OLLAMA_EMBED_URL, json={"model": MODEL_NAME, "prompt": text})
+        response = await client.post(OLLAMA_EMBED_URL, json={"model": MODEL_NAME, "prompt": text})
         response.raise_for_status()
         # The embedding is in the 'embedding' key of the JSON response
         return np.array(response.json()["embedding"])
@@ -17,12 +18,13 @@ def get_embedding(text: str) -> np.ndarray:
 
 def cosine_similarity(v1, v2):
     """Calculates cosine similarity between two vectors."""
-    dot_product = np.dot(v1, v2)
-    norm_v1 = np.linalg.norm(v1)
-    norm_v2 = np.linalg.norm(v2)
-    return dot_product / (norm_v1 * norm_v2)
+    return np.dot(v1, v2) / np.sqrt(np.vdot(v1, v1) * np.vdot(v2, v2))
 
-def run_test():
+def cosine_sim_batch(q, M):
+    """Calculates cosine similarity between a query vector and each row of M."""
+    return M @ q / np.sqrt(np.einsum("ij,ij->i", M, M) * np.vdot(q, q))
+
+async def run_test():
     print("--- Testing Embedding Integrity ---")
 
 
@@ -31,11 +33,14 @@ def run_test():
     sentence2 = "The sleepy feline was lying on the mat."
     sentence3 = "NASA's big, shiny, new rocket launched towards the stars."
 
-    # 2. Get embeddings
+    # 2. Get embeddings (the three requests are independent, so send them concurrently)
     print("Generating embeddings...")
-    vec1 = get_embedding(sentence1)
-    vec2 = get_embedding(sentence2)
-    vec3 = get_embedding(sentence3)
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        vec1, vec2, vec3 = await asyncio.gather(
+            get_embedding(client, sentence1),
+            get_embedding(client, sentence2),
+            get_embedding(client, sentence3),
+        )
 
     if vec1.size == 0 or vec2.size == 0 or vec3.size == 0:
         print("Failed to generate embeddings. Is Ollama running with 'embedding-gemma'?")
@@ -63,4 +68,4 @@ def run_test():
         print("❌ FAILED: Dissimilar sentences have high similarity.")
 
 if __name__ == "__main__":
-    run_test()
\ No newline at end of file
+    asyncio.run(run_test())
\ No newline at end of file
@@ -21,7 +21,8 @@ try:
     print(f"✅ Loaded extension: {VSS_PATH}")
 
     # 3. Create a dummy vector for the test query
-    dummy_vector = np.random.rand(768).astype(np.float32).tobytes()
+    rng = np.random.default_rng(seed=0)
+    dummy_vector = rng.standard_normal(768, dtype=np.float32).tobytes()
     
     # 4. Execute the vss_search function
     print("🚀 Attempting to run a vss_search query...")
@@ -1,15 +1,32 @@
 import sqlite3
+import sys
+import tempfile
 import numpy as np
 import faiss
 import os
 
+# Allow `python Testing/test_faiss.py` from the project root to import the app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 DB_PATH = os.path.join("data", "app.db")
-FAISS_INDEX_PATH = os.path.join("data", "faiss_index.bin")
+FAISS_INDEX_PATH = os.path.join("data", "faiss_index_ip.bin")  # "_ip": vectors are L2-normalized
 DIMENSION = 768  # Make sure this matches your model's dimension
 
-def bytes_to_float_list(binary_data: bytes) -> list[float]:
-    """Converts a binary blob of float32 back to a list of floats."""
-    return np.frombuffer(binary_data, dtype=np.float32)
+def decode_embedding(blob: bytes, dtype: str) -> np.ndarray:
+    """Decodes one stored embedding ('f32', 'f16', or 'sq8' = float32 scale + int8 codes)."""
+    if dtype == "sq8":
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float32) * scale
+    if dtype == "f16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    return np.frombuffer(blob, dtype=np.float32)
+
+def blobs_to_matrix(rows) -> np.ndarray:
+    """Decodes (embedding, dtype) rows into one contiguous (N, DIMENSION) float32 matrix."""
+    rows = list(rows)
+    if all(dtype == "f32" for _, dtype in rows):
+        return np.frombuffer(b"".join(blob for blob, _ in rows), dtype=np.float32).reshape(-1, DIMENSION).copy()
+    return np.stack([decode_embedding(blob, dtype) for blob, dtype in rows])
 
 def run_faiss_build_test():
     """Builds and tests the FAISS index directly from the database."""
@@ -23,14 +40,8 @@ def run_faiss_build_test():
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
 
-        # Insert a relevant test page and embedding if not present
-        test_text = "Python functions are defined using the def keyword."
-        test_vector = np.random.rand(DIMENSION).astype('float32')
-        test_vector_blob = test_vector.tobytes()
-
-
         print("Fetching all embeddings from the database...")
-        cursor.execute("SELECT id, page_id, embedding FROM embeddings")
+        cursor.execute("SELECT id, page_id, embedding, embedding_dtype FROM embeddings")
         results = cursor.fetchall()
 
         if not results:
@@ -40,11 +51,15 @@ def run_faiss_build_test():
         print(f"Found {len(results)} embeddings to index.")
 
         # We'll map the FAISS index position to the original page_id
-        index_to_page_id = {i: page_id for i, (_, page_id, _) in enumerate(results)}
-        all_vectors = np.array([bytes_to_float_list(embedding) for _, _, embedding in results]).astype('float32')
+        index_to_page_id = np.array([page_id for _, page_id, _, _ in results], dtype=np.int64)
+        all_vectors = blobs_to_matrix((embedding, dtype) for _, _, embedding, dtype in results)
 
         # Build the FAISS index
-        index = faiss.IndexFlatL2(DIMENSION)
+        # Cosine similarity == inner product of L2-normalized vectors
+        faiss.normalize_L2(all_vectors)
+        # 8-bit scalar quantizer: 1 byte per dimension, trained on the vectors' value ranges
+        index = faiss.IndexScalarQuantizer(DIMENSION, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(all_vectors)
         index.add(all_vectors)
         print(f"✅ FAISS index built successfully with {index.ntotal} vectors.")
 
@@ -54,28 +69,77 @@ def run_faiss_build_test():
 
         # Perform a test search
         print("\n🚀 Performing a test search...")
-        # Use the test vector as the query vector
-        query_vector = np.array([test_vector], dtype='float32')
+        # Use the first (already normalized) vector in our DB as the query vector
+        query_vector = all_vectors[0:1]
 
         distances, indices = index.search(query_vector, k=3)
 
         print("Search completed. Top 3 results:")
         for i, idx in enumerate(indices[0]):
-            page_id = index_to_page_id.get(idx, None)
-            distance = distances[0][i]
-            print(f"  {i+1}. Page ID: {page_id}, Distance: {distance:.4f}")
+            page_id = int(index_to_page_id[idx]) if idx >= 0 else None
+            similarity = distances[0][i]
+            print(f"  {i+1}. Page ID: {page_id}, Similarity: {similarity:.4f}")
 
         print("\n--- Verification ---")
-        if indices[0][0] is not None and page_id == page_id:
-            print("🎉 SUCCESS! The most similar item to the test vector is itself.")
+        if indices[0][0] == 0:
+            print("🎉 SUCCESS! The most similar item to the first vector is itself.")
         else:
             print("❌ FAILED: The search did not return the correct closest item.")
 
+        # Compare an HNSW graph index against exact flat search
+        print("\n🚀 Comparing HNSW against exact flat search...")
+        flat_index = faiss.IndexFlatIP(DIMENSION)
+        flat_index.add(all_vectors)
+        hnsw_index = faiss.IndexHNSWFlat(DIMENSION, 32, faiss.METRIC_INNER_PRODUCT)
+        hnsw_index.hnsw.efConstruction = 200
+        hnsw_index.add(all_vectors)
+        hnsw_index.hnsw.efSearch = 64
+
+        _, flat_top = flat_index.search(query_vector, k=1)
+        _, hnsw_top = hnsw_index.search(query_vector, k=1)
+        if flat_top[0][0] == hnsw_top[0][0]:
+            print("🎉 SUCCESS! HNSW and flat search agree on the top result.")
+        else:
+            print(f"❌ FAILED: HNSW top result {hnsw_top[0][0]} != flat top result {flat_top[0][0]}.")
+
     except Exception as e:
         print(f"\n❌ An error occurred: {e}")
     finally:
         if 'conn' in locals():
             conn.close()
 
+def run_faiss_growth_test():
+    """Grows an app FaissIndex past HNSW_MIN_VECTORS with add() and checks it switches to HNSW."""
+    from app.vector_store import FaissIndex, HNSW_MIN_VECTORS
+
+    print("\n--- Testing FAISS Index Growth Past the HNSW Threshold ---")
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((HNSW_MIN_VECTORS + 10, DIMENSION), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = FaissIndex(dimension=DIMENSION, index_path=os.path.join(tmp_dir, "index.bin"))
+        for page_id, vector in enumerate(vectors, start=1):
+            index.add(page_id, vector.tolist())
+        index.save_index()
+
+        inner = faiss.downcast_index(index.index.index)
+        print(f"Index type after {index.index.ntotal} adds: {type(inner).__name__}")
+        if index.index.ntotal != len(vectors):
+            print(f"❌ FAILED: expected {len(vectors)} vectors, found {index.index.ntotal}.")
+        elif not isinstance(inner, faiss.IndexHNSW):
+            print("❌ FAILED: the index is still a flat scan.")
+        else:
+            print("🎉 SUCCESS! The index was rebuilt as HNSW when it crossed the threshold.")
+
+        # A reload must keep the HNSW index and its page-ID labels
+        reloaded = FaissIndex(dimension=DIMENSION, index_path=index.index_path)
+        reloaded.load_index()
+        top_id, _ = reloaded.search(vectors[42].tolist(), top_k=1)[0]
+        if not reloaded.needs_rebuild() and top_id == 43:
+            print("🎉 SUCCESS! The saved index reloads as HNSW and finds the right page.")
+        else:
+            print(f"❌ FAILED: reload needs_rebuild={reloaded.needs_rebuild()}, top page {top_id} != 43.")
+
 if __name__ == "__main__":
-    run_faiss_build_test()
\ No newline at end of file
+    run_faiss_build_test()
+    run_faiss_growth_test()
\ No newline at end of file
@@ -18,15 +18,19 @@ def verify_stored_dimension():
         cursor = conn.cursor()
 
         # Fetch the binary data of the first embedding
-        cursor.execute("SELECT embedding FROM embeddings LIMIT 1;")
+        cursor.execute("SELECT embedding, embedding_dtype FROM embeddings LIMIT 1;")
         result = cursor.fetchone()
 
         if result:
-            embedding_blob = result[0]
+            embedding_blob, embedding_dtype = result
             
-            # Convert the binary blob back into a numpy array of float32
-            float_array = np.frombuffer(embedding_blob, dtype=np.float32)
-            dimension = len(float_array)
+            # 'sq8' blobs are a float32 scale followed by one int8 code per dimension
+            if embedding_dtype == "sq8":
+                dimension = len(embedding_blob) - 4
+            elif embedding_dtype == "f16":
+                dimension = len(embedding_blob) // 2
+            else:
+                dimension = len(np.frombuffer(embedding_blob, dtype=np.float32))
             
             print(f"\n✅ Success! The stored embedding has a dimension of: {dimension}")
             
@@ -7,46 +7,39 @@ web page data, highlights, history, and search functionality.
 
 from app.schemas import ChatRequest
 from typing import List, Optional, Any, Dict
-from fastapi import APIRouter, Request, status, HTTPException, Depends, Query
-from fastapi.responses import JSONResponse
+import asyncio
+import zlib
+import numpy as np
+import orjson
+from fastapi import APIRouter, Request, Response, status, HTTPException, Depends, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 import logging
-import httpx
+from app.config import settings
 from app.db.database import get_db
+from app.ollama_client import chat_completion
+from app.embedding_cache import cached_embedding
+from app.search_batcher import search_batcher
+from app import search_cache
 from app.content_processor import ContentProcessor
 from app.models.models import now
 from app.schemas import (
-    PageCreate, PageDetailRead, PageBasicRead, PageUpdate, 
+    PageCreate, PageDetailRead, PageUpdate, 
     PageAccessUpdate, EmbeddingCreate, TimeSpentBase, 
     SemanticSearchRequest, SearchResult, MessageResponse, 
-    HistoryRead, PageType, ImageCreate
+    PageType, ImageCreate, PageListResponse, HistoryListResponse,
+    PageWithEmbeddingRead, PageWithRawEmbeddingRead
 )
 import app.crud as crud
 
 
 
+# Create API router
 router = APIRouter()
 
-# Set up logger
 # Set up logger
 logger = logging.getLogger(__name__)
 
-# Ollama embedding helper
-async def get_embedding(text: str) -> list[float]:
-    """Call Ollama API to generate embedding for the given text."""
-    logger.info("Generating embedding...")
-    url = "http://127.0.0.1:11434/api/embeddings"
-    payload = {"model": "embeddinggemma:latest", "prompt": text}
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=payload, timeout=60.0)
-        response.raise_for_status()
-        data = response.json()
-        embedding = data.get("embedding", [])
-        logger.info(f"Embedding received. First 5 values: {embedding[:5]}")
-        return embedding
-
-# Create API router
-
 
 # --- RAG Chat Endpoint ---
 @router.post("/chat", tags=["Chat"])
@@ -54,23 +47,30 @@ async def rag_chat(request: ChatRequest, db: Session = Depends(get_db)):
     """
     RAG chat endpoint: retrieves relevant context and sends a prompt to Ollama for completion.
     """
-    # 1. Get embedding for the query
-    embedding = await get_embedding(request.query)
-    if not embedding or len(embedding) != 768:
-        raise HTTPException(status_code=500, detail="Failed to generate embedding for query.")
-
-    # 2. Retrieve top 3-4 relevant pages
-    results = crud.semantic_search(db, embedding, top_k=4)
+    # 1-2. Retrieve top 3-4 relevant pages, embedding the query only on a cache miss
+    results = search_cache.get(request.query, 4)
+    if results is None:
+        version = search_cache.current_version()
+        embedding = await cached_embedding(request.query)
+        if not embedding or len(embedding) != 768:
+            raise HTTPException(status_code=500, detail="Failed to generate embedding for query.")
+        # Sync DB work runs off the event loop
+        results = await asyncio.to_thread(crud.semantic_search, db, embedding, 4)
+        search_cache.put(request.query, 4, version, results)
     page_ids = [page_id for page_id, _ in results]
-    pages = crud.get_pages_by_ids(db, page_ids)
+    rows = {row[0]: row for row in await asyncio.to_thread(crud.get_pages_for_rag, db, page_ids)}
 
-    # 3. Build context from page texts
+    # 3. Build context from page texts, in search rank order
     context_chunks = []
     sources = []
-    for page in pages:
-        if page.text:
-            context_chunks.append(f"[Source: {page.title}]\n{page.text.strip()}\n")
-            sources.append({"id": page.id, "title": page.title, "url": page.url})
+    for page_id in page_ids:
+        row = rows.get(page_id)
+        if row is None:
+            continue
+        _, title, url, text = row
+        if text:
+            context_chunks.append(f"[Source: {title}]\n{text.strip()}\n")
+            sources.append({"id": page_id, "title": title, "url": url})
     context = "\n---\n".join(context_chunks)
 
     # 4. Construct prompt for Ollama
@@ -81,14 +81,9 @@ async def rag_chat(request: ChatRequest, db: Session = Depends(get_db)):
         "\nIf you use information from a source, cite it by title in your answer."
     )
 
-    # 5. Call Ollama's chat completion endpoint
-    ollama_url = "http://127.0.0.1:11434/api/chat"
-    payload = {"model": "gpt-oss:20b", "messages": [{"role": "user", "content": prompt}]}
-    async with httpx.AsyncClient() as client:
-        response = await client.post(ollama_url, json=payload, timeout=60.0)
-        response.raise_for_status()
-        data = response.json()
-        answer = data.get("message", data.get("response", ""))
+    # 5. Call Ollama's chat completion endpoint (cached by model + prompt)
+    data = await chat_completion(prompt, use_cache=request.use_cache)
+    answer = data.get("message", data.get("response", ""))
 
     return {"answer": answer, "sources": sources}
 
@@ -123,15 +118,13 @@ def create_page(
     - PDF metadata (if page_type is 'pdf')
     - Embeddings
     """
-    # Check if a page with the same URL already exists
-    existing_page = db.query(crud.Page).filter(crud.Page.url == page_data.url).first()
-    if existing_page:
+    db_page = crud.create_page(db=db, page_data=page_data)
+    if db_page is None:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"Page with URL '{page_data.url}' already exists"
         )
-    
-    return crud.create_page(db=db, page_data=page_data)
+    return db_page
 
 
 @router.get(
@@ -142,17 +135,24 @@ def create_page(
 def read_page(
     page_id: int, 
     include_embedding: bool = False,
+    raw: bool = False,
     db: Session = Depends(get_db)
 ):
     """
     Get a page by ID with all related data.
     
     Query Parameters:
-    - include_embedding: If true, includes raw embedding vectors
+    - include_embedding: If true, includes the embedding vectors
+    - raw: With include_embedding, return each vector as base64 little-endian
+      float32 (`embedding_b64`) instead of a JSON float list
     """
     db_page = crud.get_page(db, page_id, include_embedding=include_embedding)
     if db_page is None:
         raise HTTPException(status_code=404, detail=f"Page with ID {page_id} not found")
+    if include_embedding:
+        # Returned as a Response so response_model doesn't strip the vectors
+        schema = PageWithRawEmbeddingRead if raw else PageWithEmbeddingRead
+        return ORJSONResponse(schema.model_validate(db_page).model_dump())
     return db_page
 
 
@@ -192,16 +192,62 @@ def add_page_embedding(
     """
     Add a new embedding vector to an existing page.
     """
-    # Check if page exists
-    db_page = db.query(crud.Page).filter(crud.Page.id == page_id).first()
+    db_page = crud.add_embedding_to_page(
+        db, page_id, embedding_data.model_name, embedding_data.embedding
+    )
     if db_page is None:
         raise HTTPException(status_code=404, detail=f"Page with ID {page_id} not found")
-    
-    # Add the embedding
-    crud.add_embedding(db, page_id, embedding_data)
-    
-    # Return the updated page (with embedding metadata)
-    return crud.get_page(db, page_id)
+    return db_page
+
+
+@router.post(
+    "/pages/{page_id}/embedding/raw",
+    response_model=PageDetailRead,
+    tags=["Embeddings"]
+)
+async def add_page_embedding_raw(
+    page_id: int,
+    request: Request,
+    model_name: str = Query(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Add an embedding sent as an application/octet-stream body of 768
+    little-endian float32 values (3072 bytes), skipping JSON float parsing.
+    """
+    body = await request.body()
+    if len(body) != 768 * 4:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Expected {768 * 4} bytes of float32 data, got {len(body)}"
+        )
+    vector = np.frombuffer(body, dtype="<f4")
+    db_page = await asyncio.to_thread(crud.add_embedding_to_page, db, page_id, model_name, vector)
+    if db_page is None:
+        raise HTTPException(status_code=404, detail=f"Page with ID {page_id} not found")
+    return db_page
+
+
+@router.get(
+    "/embeddings/{embedding_id}/raw",
+    response_class=Response,
+    responses={200: {"content": {"application/octet-stream": {}}}},
+    tags=["Embeddings"]
+)
+def read_embedding_raw(embedding_id: int, db: Session = Depends(get_db)):
+    """
+    Get one embedding vector as raw little-endian float32 bytes
+    (application/octet-stream); the model name is in X-Embedding-Model.
+    """
+    row = crud.get_embedding_blob(db, embedding_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Embedding with ID {embedding_id} not found")
+    blob, dtype, model_name = row
+    return Response(
+        crud.embedding_to_float32_bytes(blob, dtype),
+        media_type="application/octet-stream",
+        headers={"X-Embedding-Model": model_name}
+    )
 
 
 @router.post(
@@ -226,55 +272,59 @@ def add_page_time_spent(
 
 @router.get(
     "/pages", 
-    response_model=List[PageBasicRead],
+    response_model=PageListResponse,
     tags=["Pages"]
 )
 def list_pages(
     page_type: Optional[str] = None,
     q: Optional[str] = None,
     limit: int = Query(20, gt=0, le=100),
-    offset: int = Query(0, ge=0),
+    after_id: Optional[int] = Query(None),
     db: Session = Depends(get_db)
 ):
     """
-    List pages with optional filtering and pagination.
+    List pages with optional filtering and cursor pagination, newest first.
     
     Query Parameters:
     - page_type: Filter by page type ('web' or 'pdf')
-    - q: Search query text (searches title and URL)
+    - q: Search text, matched case-insensitively against title and URL only
+      (not page text). A URL is prefix-matched; otherwise every word of 3+
+      characters must appear in the title or URL, and a query of only
+      shorter words is matched as a single substring
     - limit: Maximum number of results (default: 20, max: 100)
-    - offset: Number of results to skip (for pagination)
+    - after_id: Cursor from the previous response's next_cursor
     """
-    return crud.get_pages(db, page_type=page_type, query_text=q, limit=limit, offset=offset)
+    pages = crud.get_pages(db, page_type=page_type, query_text=q, limit=limit, after_id=after_id)
+    next_cursor = pages[-1].id if len(pages) == limit else None
+    return PageListResponse(items=pages, next_cursor=next_cursor)
 
 
 @router.get(
     "/history", 
-    response_model=List[HistoryRead],
+    response_model=HistoryListResponse,
     tags=["History"]
 )
 def list_history(
     page_id: Optional[int] = None,
     limit: int = Query(50, gt=0, le=100),
-    offset: int = Query(0, ge=0),
+    after_id: Optional[int] = Query(None),
     db: Session = Depends(get_db)
 ):
     """
-    List history entries, optionally filtered by page.
+    List history entries, optionally filtered by page, newest first.
     
     Query Parameters:
     - page_id: Filter by page ID
     - limit: Maximum number of results (default: 50, max: 100)
-    - offset: Number of results to skip (for pagination)
+    - after_id: Cursor from the previous response's next_cursor
     """
-    return crud.get_history(db, page_id=page_id, limit=limit, offset=offset)
+    entries = crud.get_history(db, page_id=page_id, limit=limit, after_id=after_id)
+    next_cursor = entries[-1].id if len(entries) == limit else None
+    return HistoryListResponse(items=entries, next_cursor=next_cursor)
 
 
 
-# --- New Semantic Search Endpoint ---
-import asyncio
-from app.models.models import Page
-
+# --- Semantic Search Endpoint ---
 @router.post(
     "/search/semantic",
     response_model=List[SearchResult],
@@ -287,18 +337,26 @@ async def semantic_search(
     """
     Perform semantic search over all pages using a text query.
     1. Generate embedding for the query using Ollama.
-    2. Use sqlite-vss to find top_k most similar pages.
+    2. Find the top_k most similar pages with the configured vector backend.
     3. Return results with page info and similarity score.
     """
-    # 1. Generate embedding for the query
-    embedding = await get_embedding(request.query)
-    if not embedding or len(embedding) != 768:
-        raise HTTPException(status_code=500, detail="Failed to generate embedding for query.")
-
-    # 2. Perform vector search
-    results = crud.semantic_search(db, embedding, top_k=request.top_k)
+    # Repeated queries are answered from the result cache until the index changes
+    results = search_cache.get(request.query, request.top_k)
+    if results is None:
+        version = search_cache.current_version()
+        # 1. Generate embedding for the query
+        embedding = await cached_embedding(request.query)
+        if not embedding or len(embedding) != 768:
+            raise HTTPException(status_code=500, detail="Failed to generate embedding for query.")
+
+        # 2. Perform vector search (in-process backends batch concurrent queries)
+        if settings.VECTOR_SEARCH_BACKEND in ("faiss", "numpy"):
+            results = await search_batcher.search(embedding, top_k=request.top_k)
+        else:
+            results = await asyncio.to_thread(crud.semantic_search, db, embedding, request.top_k)
+        search_cache.put(request.query, request.top_k, version, results)
     page_ids = [page_id for page_id, _ in results]
-    pages = {p.id: p for p in crud.get_pages_by_ids(db, page_ids)}
+    pages = {p.id: p for p in await asyncio.to_thread(crud.get_pages_by_ids, db, page_ids)}
 
     # 3. Format results
     search_results = []
@@ -314,8 +372,32 @@ async def semantic_search(
     return search_results
 
 
+def _gunzip_body(body: bytes, max_size: int) -> bytes:
+    """
+    Decompress a gzip request body, producing at most max_size bytes.
+
+    The output is bounded while decompressing, so a small gzip bomb can't
+    exhaust memory. Raises HTTPException 413 if the body inflates past
+    max_size and 400 if it is not valid, complete gzip data.
+    """
+    decompressor = zlib.decompressobj(wbits=31)  # 31: expect a gzip header
+    try:
+        data = decompressor.decompress(body, max_size + 1)
+    except zlib.error as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid gzip body: {e}")
+    if len(data) > max_size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Decompressed body too large")
+    if not decompressor.eof:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid gzip body: truncated")
+    return data
+
+
 @router.post("/collect", tags=["Collect"])
-async def collect_content(request: Request, db: Session = Depends(get_db)):
+async def collect_content(
+    request: Request,
+    echo: bool = Query(False),
+    db: Session = Depends(get_db)
+):
     """
     Endpoint to process and store incoming raw HTML content from extension.
     
@@ -329,11 +411,20 @@ async def collect_content(request: Request, db: Session = Depends(get_db)):
         "accessedAt": "..."
     }
     
-    Returns processed text, minimal HTML, and metadata.
+    Returns the stored page ID and metadata. Processed text, minimal HTML,
+    meta and images are only echoed back with ?echo=true; otherwise fetch
+    them from GET /pages/{id}.
     """
     try:
-        data = await request.json()
-        logger.info(f"[ResearchBoard] Received /collect payload: {data}")
+        # orjson parses straight from bytes; the payload may carry megabytes of HTML.
+        # The extension gzips the body, which Starlette does not decode for us.
+        body = await request.body()
+        max_body = settings.MAX_PAGE_CONTENT_LENGTH * settings.MAX_COLLECT_BODY_FACTOR
+        if request.headers.get("content-encoding", "").lower() == "gzip":
+            body = await asyncio.to_thread(_gunzip_body, body, max_body)
+        elif len(body) > max_body:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Request body too large")
+        data = orjson.loads(body)
         
         html = data.get("html")
         url = data.get("url")
@@ -343,21 +434,48 @@ async def collect_content(request: Request, db: Session = Depends(get_db)):
         raw_text = data.get("text")
         accessed_at = data.get("accessedAt")
         
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "[ResearchBoard] Received /collect payload: url=%s html_len=%d images=%d",
+                url, len(html or ""), len(images_data)
+            )
+        
         if not html or not url:
-            logger.error(f"[ResearchBoard] Missing html or url in payload: {data}")
+            logger.error("[ResearchBoard] Missing html or url in payload (keys: %s)", sorted(data))
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing html or url")
         
-        # Process HTML content
-        result = ContentProcessor.process(html, url)
-        logger.info(f"[ResearchBoard] Processed content for: {url}")
+        # Process HTML content in the worker process pool (ContentProcessor is stateless)
+        result = await asyncio.get_running_loop().run_in_executor(
+            request.app.state.html_pool, ContentProcessor.process, html, url
+        )
+        logger.info("[ResearchBoard] Processed content for: %s", url)
         
         if result.get("error"):
-            logger.error(f"[ResearchBoard] ContentProcessor error: {result['error']}")
-            return JSONResponse(status_code=400, content={"error": result["error"]})
+            logger.error("[ResearchBoard] ContentProcessor error: %s", result['error'])
+            return ORJSONResponse(status_code=400, content={"error": result["error"]})
         
+        # Identical content is already stored (possibly under another URL):
+        # record the visit instead of embedding and storing it again. Pages
+        # with (near-)empty extracted text all hash alike, so they are not
+        # deduplicated.
+        content_hash = result.get("content_hash")
+        existing_id = None
+        if content_hash and len(result.get("text") or "") >= settings.MIN_DEDUP_TEXT_LENGTH:
+            existing_id = await asyncio.to_thread(crud.get_page_id_by_content_hash, db, content_hash)
+        if existing_id is not None:
+            # Only the timestamp is reported back, so skip loading the page
+            await asyncio.to_thread(crud.record_page_access, db, existing_id)
+            logger.info("[ResearchBoard] Content for %s matches page id %s", url, existing_id)
+            return {
+                "success": True,
+                "page_id": existing_id,
+                "duplicate": True,
+                "content_hash": content_hash,
+                "accessed_at": accessed_at
+            }
 
         # Generate embedding using Ollama
-        embedding = await get_embedding(result["text"])
+        embedding = await cached_embedding(result["text"])
 
         # Prepare page data
         page_data = PageCreate(
@@ -368,6 +486,7 @@ async def collect_content(request: Request, db: Session = Depends(get_db)):
             content_html=result["html"],
             text=result["text"],
             page_type=PageType.WEB,
+            content_hash=content_hash,
             images=[
                 ImageCreate(
                     image_url=img.get("src", ""),
@@ -379,29 +498,43 @@ async def collect_content(request: Request, db: Session = Depends(get_db)):
 
         # Store in database
         try:
-            page = crud.create_page(db=db, page_data=page_data, embedding=embedding)
-            logger.info(f"[ResearchBoard] Stored page id {page.id} for url {url}")
+            # Only the ID is reported back, so skip create_page's reload
+            page_id = await asyncio.to_thread(crud.insert_page, db, page_data, embedding)
+            if page_id is None:
+                logger.info("[ResearchBoard] Page already stored for url %s", url)
+                return ORJSONResponse(
+                    status_code=status.HTTP_409_CONFLICT,
+                    content={"error": f"Page with URL '{url}' already exists"}
+                )
+            logger.info("[ResearchBoard] Stored page id %s for url %s", page_id, url)
 
-            return {
+            response = {
                 "success": True,
-                "page_id": page.id,
+                "page_id": page_id,
                 "title": result["title"] or title,
                 "author": result.get("author"),
                 "publish_date": result.get("publish_date"),
                 "content_hash": result.get("content_hash"),
-                "text": result.get("text"),
-                "html": result.get("html"),
-                "meta": meta,
-                "images": images_data,
                 "accessed_at": accessed_at
             }
+            if echo:
+                response.update(
+                    text=result.get("text"),
+                    html=result.get("html"),
+                    meta=meta,
+                    images=images_data
+                )
+            return response
         except Exception as db_error:
-            logger.error(f"[ResearchBoard] Database error: {db_error}")
-            return JSONResponse(
+            logger.error("[ResearchBoard] Database error: %s", db_error)
+            return ORJSONResponse(
                 status_code=500, 
                 content={"error": f"Database error: {str(db_error)}"}
             )
             
+    except HTTPException:
+        # 400/413 from validation and decompression keep their status codes
+        raise
     except Exception as e:
-        logger.error(f"[ResearchBoard] Exception in /collect: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        logger.error("[ResearchBoard] Exception in /collect: %s", e)
+        return ORJSONResponse(status_code=500, content={"error": str(e)})
@@ -7,16 +7,22 @@ routers, and essential endpoints for the research assistant.
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 import logging
+import multiprocessing
+import os
 from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
 
 from app.config import settings
-from app.db.database import engine, Base
+from app.db.database import engine, Base, run_migrations
 from app.api.routes import router as api_router
+from app.ollama_client import close_http_client
+from app.search_batcher import search_batcher
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 
@@ -29,12 +35,25 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up Research Board backend...")
     Base.metadata.create_all(bind=engine)
+    run_migrations()
     logger.info("Database tables created successfully")
+
+    # HTML extraction is CPU-bound and holds the GIL; parse in worker processes.
+    # Spawned rather than forked: by the first /collect this process runs
+    # OpenMP and thread-pool threads whose held locks a fork would copy, and
+    # a forked child would also inherit the loaded index and matrix.
+    app.state.html_pool = ProcessPoolExecutor(
+        max_workers=min(settings.HTML_POOL_WORKERS, os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn")
+    )
     
     yield
     
     # Shutdown
     logger.info("Shutting down Research Board backend...")
+    await close_http_client()
+    await search_batcher.close()
+    app.state.html_pool.shutdown(wait=False, cancel_futures=True)
 
 
 # Create FastAPI application
@@ -44,6 +63,7 @@ app = FastAPI(
     version=settings.API_VERSION,
     docs_url=f"{settings.API_PREFIX}/docs",
     redoc_url=f"{settings.API_PREFIX}/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -56,6 +76,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses for clients that send Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
@@ -92,8 +115,8 @@ async def health_check():
             "version": settings.API_VERSION
         }
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return JSONResponse(
+        logger.error("Health check failed: %s", e)
+        return ORJSONResponse(
             status_code=503,
             content={
                 "status": "unhealthy",
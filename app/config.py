@@ -6,6 +6,7 @@ settings for the FastAPI application.
 """
 
 import os
+from functools import lru_cache
 from typing import List
 from pydantic_settings import BaseSettings
 
@@ -42,8 +43,42 @@ class Settings(BaseSettings):
     
     # Application Settings
     MAX_PAGE_CONTENT_LENGTH: int = 50000  # Maximum content length to store
+    # Cap on a decompressed /collect body. The raw HTML, text and image list
+    # it carries are far larger than the MAX_PAGE_CONTENT_LENGTH kept from
+    # them, so the cap is a multiple of it (50000 * 400 = ~20 MB)
+    MAX_COLLECT_BODY_FACTOR: int = 400
+    MIN_DEDUP_TEXT_LENGTH: int = 50       # Shorter extracted text is never deduplicated by hash
     MAX_HIGHLIGHTS_PER_PAGE: int = 100    # Maximum highlights per page
+    HTML_POOL_WORKERS: int = 4            # Processes for HTML extraction (capped at the CPU count)
     ENABLE_SEMANTIC_SEARCH: bool = True
+    # Vector search backend: 'faiss' (in-process index), 'sqlite-vec'
+    # (vec0 virtual table inside the database; requires the sqlite-vec package)
+    # or 'numpy' (exact scan over an in-memory float32 matrix)
+    VECTOR_SEARCH_BACKEND: str = "faiss"
+    # In-memory format of the 'numpy' backend's matrix: 'f32' or 'int8'
+    # (per-row scale + int8 codes, 4x less RAM and scan bandwidth)
+    EMBEDDING_MATRIX_DTYPE: str = "f32"
+    # Keep a copy of the 'numpy' backend's f32 matrix on a CUDA GPU and scan
+    # it there with CuPy (optional dependency) once the corpus is large enough
+    EMBEDDING_MATRIX_GPU: bool = False
+    # Storage format for new embeddings: 'f32' (raw float32), 'f16'
+    # (half precision, 2x smaller, near-lossless for cosine) or 'sq8'
+    # (int8 codes + one float32 scale per vector, ~4x smaller)
+    EMBEDDING_STORAGE_DTYPE: str = "f32"
+    # Memory-map the persisted FAISS index instead of reading it into RAM.
+    # Keep the index file on local disk; mmap over network filesystems is slow.
+    FAISS_INDEX_MMAP: bool = True
+    # Index corpora of at least this many vectors with OPQ + IVF-PQ (32 bytes
+    # per vector, approximate) instead of HNSW; 0 keeps HNSW at any size.
+    # A saved index that crosses it is retrained at startup, or in a
+    # background thread once an insert crosses it at runtime
+    FAISS_IVFPQ_MIN_VECTORS: int = 0
+    # IVF lists scanned per query once IVF-PQ is in use (recall vs. latency)
+    FAISS_NPROBE: int = 16
+    
+    # SQLite connection tuning (applied per pooled connection)
+    SQLITE_CACHE_SIZE_MB: int = 64    # Page cache per connection
+    SQLITE_MMAP_SIZE_MB: int = 256    # Memory-mapped read window
     
     # Logging
     LOG_LEVEL: str = "INFO"
@@ -60,10 +95,14 @@ class Settings(BaseSettings):
 settings = Settings()
 
 
+@lru_cache(maxsize=1)
 def get_database_url() -> str:
     """
     Get the properly formatted database URL.
     
+    Resolved once; the relative path is anchored to the working directory
+    at first call rather than re-resolved with a getcwd on every call.
+    
     Returns:
         str: SQLite database URL with absolute path
     """
@@ -1,13 +1,34 @@
 """
 ContentProcessor service for extracting clean text and metadata from raw HTML.
-Uses readability-lxml for main content extraction and BeautifulSoup for sanitization.
+Uses readability-lxml for main content extraction and lxml's Cleaner for sanitization.
 """
 
-import hashlib
 from typing import Dict, Any, Optional
+import lxml.html
+from lxml.html.clean import Cleaner
+from blake3 import blake3
 from readability import Document
-from bs4 import BeautifulSoup
-import re
+
+# Strips <script>, <style> and <iframe> plus on* handler attributes, and
+# leaves everything else (structure, links, inline styles) untouched
+_cleaner = Cleaner(
+    scripts=True,
+    javascript=True,
+    style=True,
+    inline_style=False,
+    kill_tags=["iframe"],
+    comments=False,
+    links=False,
+    meta=False,
+    page_structure=False,
+    processing_instructions=False,
+    embedded=False,
+    frames=False,
+    forms=False,
+    annoying_tags=False,
+    remove_unknown_tags=False,
+    safe_attrs_only=False
+)
 
 class ContentProcessor:
     @staticmethod
@@ -24,36 +45,34 @@ class ContentProcessor:
                 'title': Title,
                 'author': Author (if found),
                 'publish_date': Publish date (if found),
-                'content_hash': SHA256 hash of text for deduplication
+                'content_hash': BLAKE3 hash of text for deduplication
             }
         """
         try:
-            # Step 1: Extract main content using readability-lxml
-            doc = Document(html)
+            # Parse the raw page once; readability and the metadata scan share the tree.
+            # Encoding to bytes sidesteps lxml rejecting str input with an XML declaration.
+            parser = lxml.html.HTMLParser(encoding="utf-8")
+            tree = lxml.html.document_fromstring(html.encode("utf-8"), parser=parser)
+
+            # Step 1: Extract main content using readability-lxml (it cleans a copy of the tree)
+            doc = Document(tree)
             title = doc.short_title()
             readable_html = doc.summary(html_partial=True)
 
-            # Step 2: Sanitize HTML with BeautifulSoup
-            soup = BeautifulSoup(readable_html, "lxml")
-            # Remove unwanted tags
-            for tag in soup(["script", "style", "iframe"]):
-                tag.decompose()
-            # Remove event handler attributes
-            for tag in soup.find_all(True):
-                attrs = list(tag.attrs.keys())
-                for attr in attrs:
-                    if re.match(r"on[a-zA-Z]+", attr):
-                        del tag.attrs[attr]
+            # Step 2: Sanitize the extracted fragment in place with lxml
+            root = lxml.html.fromstring(readable_html)
+            _cleaner(root)
             # Minimal HTML for rendering
-            minimal_html = str(soup)
-            # Extract plain text
-            clean_text = soup.get_text(separator="\n", strip=True)
+            minimal_html = lxml.html.tostring(root, encoding="unicode")
+            # Extract plain text: one stripped line per non-blank text node
+            clean_text = "\n".join(
+                stripped for chunk in root.itertext() if (stripped := chunk.strip())
+            )
 
             # Step 3: Extract metadata
             author = None
             publish_date = None
-            meta_tags = BeautifulSoup(html, "lxml").find_all("meta")
-            for meta in meta_tags:
+            for meta in tree.xpath("//meta[@name or @property]"):
                 name = meta.get("name", "").lower()
                 prop = meta.get("property", "").lower()
                 if name in ["author", "article:author"] or prop in ["author", "article:author"]:
@@ -62,7 +81,9 @@ class ContentProcessor:
                     publish_date = meta.get("content")
 
             # Step 4: Generate content hash for deduplication
-            content_hash = hashlib.sha256(clean_text.encode("utf-8")).hexdigest()
+            # BLAKE3 is not needed for security here, only speed: its SIMD kernels
+            # hash large article bodies several times faster than SHA-256
+            content_hash = blake3(clean_text.encode("utf-8")).hexdigest()
 
             return {
                 "text": clean_text,
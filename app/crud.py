@@ -1,5 +1,9 @@
+import base64
 # Import the global faiss_index
 from app.vector_store import faiss_index
+import app.sqlite_vec_store as sqlite_vec_store
+from app.matrix_store import embedding_matrix
+import app.search_cache as search_cache
 # Add logging import and logger instance
 import logging
 logger = logging.getLogger(__name__)
@@ -10,15 +14,17 @@ This module provides helper functions for Create, Read, Update, Delete
 operations on database models, abstracting SQL operations.
 """
 
-from sqlalchemy.orm import Session, joinedload, contains_eager
-from sqlalchemy import func, select, desc, text
-from typing import List, Optional, Tuple, Dict, Any
+from sqlalchemy.orm import Session, joinedload, selectinload, contains_eager, load_only, raiseload, undefer
+from sqlalchemy import func, select, desc, text, insert, update, or_, lambda_stmt, Row
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import List, Optional, Tuple, Dict, Any, Union, Iterator
 import datetime
 import struct
 import numpy as np
+from app.config import settings
 from app.models.models import (
     Page, Image, PDF, Embedding, PageTimeSpent, 
-    History, User, now
+    History, User, SQL_NOW
 )
 from app.schemas import (
     PageCreate, ImageCreate, PDFCreate, EmbeddingCreate,
@@ -26,18 +32,185 @@ from app.schemas import (
 )
 
 # Helper functions for vector conversions
-def float_list_to_bytes(vector: List[float]) -> bytes:
-    """Convert a list of float values to a binary blob of float32."""
-    return np.array(vector, dtype=np.float32).tobytes()
+def float_list_to_bytes(vector: Union[List[float], np.ndarray]) -> bytes:
+    """
+    Convert a list of float values (or a 1-D array) to a binary blob of float32.
+    
+    A C-contiguous float32 ndarray is passed through without the
+    intermediate copy np.array would make; tobytes() is the only copy.
+    """
+    return np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+
+def float_lists_to_blobs(vectors: List[List[float]]) -> List[bytes]:
+    """Convert equal-length float lists (or a 2-D array) to float32 blobs with one array conversion."""
+    return split_row_bytes(np.asarray(vectors, dtype=np.float32))
+
+def split_row_bytes(matrix: np.ndarray) -> List[bytes]:
+    """Serialize a 2-D array with one tobytes() call and slice it into per-row blobs."""
+    raw = matrix.tobytes()
+    row_bytes = matrix.shape[1] * matrix.itemsize if matrix.ndim == 2 else 0
+    if not row_bytes:
+        return [b""] * len(matrix)
+    return [raw[start:start + row_bytes] for start in range(0, len(raw), row_bytes)]
+
+def decode_embedding(binary_data: bytes, dtype: str = "f32") -> np.ndarray:
+    """Decode a stored embedding blob into a float32 array according to its dtype."""
+    if dtype == "sq8":
+        scale = np.frombuffer(binary_data, dtype=np.float32, count=1)[0]
+        return np.frombuffer(binary_data, dtype=np.int8, offset=4).astype(np.float32) * scale
+    if dtype == "f16":
+        return np.frombuffer(binary_data, dtype=np.float16).astype(np.float32)
+    return bytes_to_ndarray(binary_data)
+
+def decode_embedding_rows(rows, dimension: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode (page_id, blob, dtype) rows into (page_ids, (N, dimension) float32 matrix).
+    
+    When every row is a raw float32 blob of the right length, the blobs are
+    joined once and viewed as a single read-only matrix with no per-row
+    decoding; otherwise each row is decoded and rows of another dimension
+    are skipped.
+    """
+    row_bytes = dimension * 4
+    if all(dtype == "f32" and len(blob) == row_bytes for _, blob, dtype in rows):
+        matrix = np.frombuffer(b"".join(blob for _, blob, _ in rows), dtype=np.float32)
+        page_ids = np.fromiter((page_id for page_id, _, _ in rows), dtype=np.int64, count=len(rows))
+        return page_ids, matrix.reshape(len(rows), dimension)
+    page_ids, vectors = [], []
+    for page_id, blob, dtype in rows:
+        vec = decode_embedding(blob, dtype)
+        if vec.shape[0] == dimension:
+            page_ids.append(page_id)
+            vectors.append(vec)
+    matrix = np.stack(vectors) if vectors else np.empty((0, dimension), dtype=np.float32)
+    return np.asarray(page_ids, dtype=np.int64), matrix
+
+# Embedding rows fetched per round trip when streaming the whole table
+EMBEDDING_STREAM_ROWS = 4096
+
+def count_embeddings(db: Session) -> int:
+    """Return the number of stored embeddings (the row count for stream_embedding_matrix)."""
+    return db.query(func.count(Embedding.id)).scalar()
+
+def embeddings_fingerprint(db: Session) -> Tuple[int, int]:
+    """
+    Return (COUNT(*), MAX(id)) of the embeddings table.
+    
+    Cached search structures store this next to their data. A delete
+    changes the count, and an insert raises the max ID even when a delete
+    kept the count the same.
+    """
+    count, max_id = db.execute(
+        select(func.count(Embedding.id), func.coalesce(func.max(Embedding.id), 0))
+    ).one()
+    return count, max_id
+
+def iter_embedding_chunks(db: Session, dimension: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yield (page_ids, float32 matrix) for every stored embedding, a chunk at a time.
+    
+    Rows are fetched EMBEDDING_STREAM_ROWS at a time with yield_per and
+    decoded with decode_embedding_rows, so the matrices may be read-only
+    views of the fetched blobs.
+    """
+    stmt = select(
+        Embedding.page_id, Embedding.embedding, Embedding.embedding_dtype
+    ).execution_options(yield_per=EMBEDDING_STREAM_ROWS)
+    for chunk in db.execute(stmt).partitions():
+        yield decode_embedding_rows(chunk, dimension)
+
+def stream_embedding_matrix(db: Session, matrix: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    Decode every stored embedding into a preallocated (N, d) float32 matrix.
+    
+    Rows are fetched EMBEDDING_STREAM_ROWS at a time with yield_per, so
+    only one chunk of blobs is held alongside the matrix rather than the
+    whole result set. Size the matrix with count_embeddings(); rows of
+    another dimension are skipped.
+    
+    Returns:
+        (page_ids, filled): the page ID of each decoded row, and how many
+        leading rows of the matrix were written
+    """
+    page_ids = np.empty(matrix.shape[0], dtype=np.int64)
+    filled = 0
+    for chunk_ids, chunk_matrix in iter_embedding_chunks(db, matrix.shape[1]):
+        # Rows added since the COUNT can't fit; the next rebuild picks them up
+        end = min(filled + chunk_ids.shape[0], matrix.shape[0])
+        matrix[filled:end] = chunk_matrix[:end - filled]
+        page_ids[filled:end] = chunk_ids[:end - filled]
+        filled = end
+    return page_ids[:filled], filled
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a float32 matrix in place; zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+def encode_embedding(vector: List[float], dtype: str) -> bytes:
+    """
+    Encode a vector as a stored embedding blob ('f32', 'f16' or 'sq8').
+    
+    Vectors are stored L2-normalized, so a dot product against a stored
+    embedding is already its cosine similarity.
+    """
+    return encode_embeddings([vector], dtype)[0]
+
+def encode_embeddings(vectors: List[List[float]], dtype: str) -> List[bytes]:
+    """
+    Encode several vectors as stored (L2-normalized) embedding blobs.
+    
+    Equal-length vectors are stacked into one array so the Python floats
+    are unboxed in a single conversion; ragged input falls back to
+    encode_embedding per vector.
+    """
+    if not vectors:
+        return []
+    if len({len(vector) for vector in vectors}) != 1:
+        return [encode_embedding(vector, dtype) for vector in vectors]
+    arr = normalize_rows(np.array(vectors, dtype=np.float32).reshape(len(vectors), -1))
+    if dtype == "sq8":
+        # Each blob is the row's float32 scale followed by its int8 codes
+        max_abs = np.abs(arr).max(axis=1, initial=0.0)
+        scales = np.where(max_abs > 0, max_abs / 127, 1.0).astype(np.float32)
+        codes = np.round(arr / scales[:, None]).astype(np.int8)
+        return [scale.tobytes() + row.tobytes() for scale, row in zip(scales, codes)]
+    if dtype == "f16":
+        return split_row_bytes(arr.astype(np.float16))
+    return float_lists_to_blobs(arr)
+
+def bytes_to_ndarray(binary_data: bytes) -> np.ndarray:
+    """
+    View a float32 blob as a read-only 1-D array without copying.
+    
+    Prefer this over bytes_to_float_list wherever the consumer accepts an
+    array (NumPy math, FAISS, tobytes/base64 output): no Python float is
+    ever created.
+    """
+    return np.frombuffer(binary_data, dtype=np.float32)
 
 def bytes_to_float_list(binary_data: bytes) -> List[float]:
     """Convert a binary blob of float32 back to a list of floats."""
-    float_array = np.frombuffer(binary_data, dtype=np.float32)
-    # Truncate to 8 decimal places for readability and to reduce payload size
-    return [float(round(x, 8)) for x in float_array]
+    # Zero-copy view and a single tolist(); no per-element rounding or casts
+    return bytes_to_ndarray(binary_data).tolist()
+
+def bytes_to_base64(binary_data: bytes) -> str:
+    """Encode a binary blob as an ASCII base64 string."""
+    return base64.b64encode(binary_data).decode("ascii")
+
+def embedding_to_float32_bytes(binary_data: bytes, dtype: str = "f32") -> bytes:
+    """Return a stored embedding as raw little-endian float32 bytes (f32 blobs pass through)."""
+    if dtype == "f32":
+        return binary_data
+    return decode_embedding(binary_data, dtype).astype("<f4").tobytes()
+
+def embedding_to_base64(binary_data: bytes, dtype: str = "f32") -> str:
+    """Base64-encode a stored embedding as little-endian float32, whatever its storage dtype."""
+    return bytes_to_base64(embedding_to_float32_bytes(binary_data, dtype))
 
 # Page CRUD operations
-def create_page(db: Session, page_data: PageCreate, embedding: Optional[list[float]] = None) -> Page:
+def create_page(db: Session, page_data: PageCreate, embedding: Optional[list[float]] = None) -> Optional[Page]:
     """
     Create a new page record with optional related data (images, PDF, embeddings, and direct embedding vector).
     
@@ -46,76 +219,117 @@ def create_page(db: Session, page_data: PageCreate, embedding: Optional[list[flo
         page_data: Page data including optional nested resources
         embedding: Optional embedding vector to store (from Ollama)
     Returns:
-        Created Page instance with relationships populated
-    """
-    # Create the base page object
-    db_page = Page(
-        url=page_data.url,
-        title=page_data.title,
-        author=page_data.author,
-        publish_date=page_data.publish_date,
-        content_html=page_data.content_html,
-        text=page_data.text,
-        highlight=page_data.highlight,
-        page_type=page_data.page_type,
-        created_at=now(),
-        accessed_at=now()
-    )
-    db.add(db_page)
-    db.flush()  # Get the ID without committing
-
-    # Create the time spent record
-    db_time_spent = PageTimeSpent(
-        page_id=db_page.id,
-        total_seconds=0,
-        last_updated=now()
-    )
-    db.add(db_time_spent)
-
-    # Create related images if provided
-    if page_data.images:
-        add_images(db, db_page.id, page_data.images)
-
-    # Create PDF record if provided
-    if page_data.pdf and page_data.page_type == PageType.PDF:
-        db_pdf = PDF(
-            page_id=db_page.id,
-            file_path=page_data.pdf.file_path,
-            num_pages=page_data.pdf.num_pages,
-            size_bytes=page_data.pdf.size_bytes
+        Created Page instance with relationships populated, or None if a
+        page with the same URL already exists
+    """
+    page_id = insert_page(db, page_data, embedding)
+    if page_id is None:
+        return None
+    # Load the page once, with get_page's eager loaders, now that all rows exist
+    return get_page(db, page_id)
+
+def insert_page(db: Session, page_data: PageCreate, embedding: Optional[list[float]] = None) -> Optional[int]:
+    """
+    Store a new page with its related rows and commit; returns only its ID.
+    
+    The page row is inserted with ON CONFLICT(url) DO NOTHING RETURNING id,
+    so the duplicate-URL check and the insert are a single statement. Every
+    child row is a Core INSERT (one executemany per table), so no ORM
+    instance is built or flushed. Callers that don't serialize the page
+    skip create_page's reload.
+    
+    Args:
+        db: Database session
+        page_data: Page data including optional nested resources
+        embedding: Optional embedding vector to store (from Ollama)
+    Returns:
+        ID of the new page, or None if a page with the same URL already exists
+    """
+    # Insert the base page, skipping it if the URL is already stored
+    stmt = (
+        sqlite_insert(Page)
+        .values(
+            url=page_data.url,
+            title=page_data.title,
+            author=page_data.author,
+            publish_date=page_data.publish_date,
+            content_html=page_data.content_html,
+            text=page_data.text,
+            highlight=page_data.highlight,
+            page_type=page_data.page_type,
+            content_hash=page_data.content_hash,
+            accessed_at=SQL_NOW  # created_at takes the same SQL default
         )
-        db.add(db_pdf)
+        .on_conflict_do_nothing(index_elements=[Page.url])
+        .returning(Page.id)
+    )
+    # Every write below is one transaction with a single commit; on failure
+    # roll it back so the session is clean for the caller
+    try:
+        page_id = db.scalar(stmt)
+        if page_id is None:
+            return None
 
-    # Create embeddings if provided
-    if page_data.embeddings:
-        for embedding_data in page_data.embeddings:
-            add_embedding(db, db_page.id, embedding_data)
+        # Create the time spent record
+        db.execute(insert(PageTimeSpent).values(page_id=page_id, total_seconds=0))
 
-    # If embedding vector is provided, store it as an Embedding
-    if embedding is not None:
-        from app.schemas import EmbeddingCreate
-        embedding_data = EmbeddingCreate(model_name="embedding-gemma", embedding=embedding)
-        add_embedding(db, db_page.id, embedding_data)
+        # Create related images if provided (one executemany)
+        if page_data.images:
+            insert_images(db, page_id, page_data.images)
 
-    # Log the page creation in history
-    log_history(db, db_page.id, HistoryAction.OPENED)
+        # Create PDF record if provided
+        if page_data.pdf and page_data.page_type == PageType.PDF:
+            db.execute(insert(PDF).values(
+                page_id=page_id,
+                file_path=page_data.pdf.file_path,
+                num_pages=page_data.pdf.num_pages,
+                size_bytes=page_data.pdf.size_bytes
+            ))
 
-    db.commit()
-    db.refresh(db_page)
-    # Add new embedding to FAISS index if present
-    if embedding is not None:
-        faiss_index.add(db_page.id, embedding)
+        # Create embeddings (provided ones plus the direct vector) in one INSERT
+        embeddings = list(page_data.embeddings or [])
+        if embedding is not None:
+            embeddings.append(EmbeddingCreate(model_name="embedding-gemma", embedding=embedding))
+        insert_embeddings(db, page_id, embeddings)
+
+        # Log the page creation in history
+        log_history(db, page_id, HistoryAction.OPENED)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    # Make the committed embeddings searchable
+    for embedding_data in embeddings:
+        index_embedding(page_id, embedding_data.embedding)
+    return page_id
+
+def index_embedding(page_id: int, vector: List[float]) -> None:
+    """
+    Add a committed embedding to the in-process search backend.
+    
+    The sqlite-vec backend is updated inside add_embedding's transaction
+    instead, so only the search result cache is invalidated for it here.
+    """
+    if settings.VECTOR_SEARCH_BACKEND == "faiss":
+        faiss_index.add(page_id, vector)
         faiss_index.save_index()
-    return db_page
-# Helper to get all embeddings as (page_id, vector) tuples
-def get_all_embeddings(db: Session):
-    from app.models.models import Embedding
-    embeddings = db.query(Embedding.page_id, Embedding.embedding).all()
-    result = []
-    for page_id, emb_blob in embeddings:
-        vec = np.frombuffer(emb_blob, dtype=np.float32)
-        result.append((page_id, vec.tolist()))
-    return result
+    elif settings.VECTOR_SEARCH_BACKEND == "numpy":
+        embedding_matrix.add(page_id, vector)
+    # After the add, so a result cached at the new version includes this vector
+    search_cache.invalidate()
+
+# Helper to get all embeddings as (page_ids, vectors) arrays
+def get_all_embeddings(db: Session, dimension: int = 768) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load every stored embedding as an (N,) int64 page ID array and an (N, d) float32 matrix.
+    
+    Rows are decoded straight into one preallocated, writable matrix (see
+    stream_embedding_matrix); no per-row Python lists are built.
+    """
+    matrix = np.empty((count_embeddings(db), dimension), dtype=np.float32)
+    page_ids, filled = stream_embedding_matrix(db, matrix)
+    return page_ids, matrix[:filled]
 
 def get_page(db: Session, page_id: int, include_embedding: bool = False) -> Optional[Page]:
     """
@@ -129,68 +343,134 @@ def get_page(db: Session, page_id: int, include_embedding: bool = False) -> Opti
     Returns:
         Page instance with relationships loaded, or None if not found
     """
-    query = db.query(Page).filter(Page.id == page_id)
-    
-    # Always load these relationships
-    query = query.options(
-        joinedload(Page.images),
-        joinedload(Page.pdf),
-        joinedload(Page.time_spent)
-    )
-    
-    # Conditionally load embeddings
+    # Always load these relationships. Collections use a separate IN query
+    # each, so images x embeddings are never multiplied into one result set;
+    # the one-to-one relationships stay joined. Embedding.embedding is
+    # deferred on the mapper, so only metadata loads unless the vectors
+    # were asked for. Each branch is its own cached lambda statement. In
+    # DEBUG, any other relationship access raises instead of lazy-loading.
     if include_embedding:
-        query = query.options(joinedload(Page.embeddings))
+        stmt = lambda_stmt(lambda: select(Page).options(
+            selectinload(Page.images),
+            joinedload(Page.pdf),
+            joinedload(Page.time_spent),
+            selectinload(Page.embeddings).undefer(Embedding.embedding)
+        ))
     else:
-        # Just load metadata without the actual vectors
-        query = query.options(
-            joinedload(Page.embeddings).load_only(
-                Embedding.id, Embedding.model_name, Embedding.created_at
-            )
-        )
+        stmt = lambda_stmt(lambda: select(Page).options(
+            selectinload(Page.images),
+            joinedload(Page.pdf),
+            joinedload(Page.time_spent),
+            selectinload(Page.embeddings)
+        ))
+    if settings.DEBUG:
+        stmt += lambda s: s.options(raiseload("*"))
+    stmt += lambda s: s.where(Page.id == page_id)
+    return db.scalars(stmt).first()
+
+# The trigram index cannot match substrings shorter than this
+FTS_MIN_TOKEN_CHARS = 3
+
+def fts_match_expression(query_text: str) -> str:
+    """
+    Build an FTS5 MATCH expression for the trigram index from free text.
+    
+    Each whitespace-separated token is double-quoted (so FTS5 operators and
+    punctuation are taken literally) and matched as a substring of the
+    title or url, the only indexed columns; tokens are ANDed. Tokens too
+    short for a trigram lookup are left out, so the result is empty when
+    none remain.
+    """
+    return " ".join(
+        '"' + token.replace('"', '""') + '"'
+        for token in query_text.split()
+        if len(token) >= FTS_MIN_TOKEN_CHARS
+    )
+
+def get_page_id_by_content_hash(db: Session, content_hash: str) -> Optional[int]:
+    """
+    Find a stored page with identical extracted text.
     
-    return query.first()
+    Args:
+        db: Database session
+        content_hash: Content hash produced by ContentProcessor
+        
+    Returns:
+        ID of the matching page, or None if no page has this hash
+    """
+    return db.query(Page.id).filter(Page.content_hash == content_hash).limit(1).scalar()
 
 def get_pages(
     db: Session, 
     page_type: Optional[str] = None, 
     query_text: Optional[str] = None,
     limit: int = 20, 
-    offset: int = 0
-) -> List[Page]:
+    after_id: Optional[int] = None
+) -> List[Row]:
     """
-    List pages with optional filtering.
+    List pages with optional filtering, newest first.
+    
+    Returns Core rows of just the list-view columns (id, url, title,
+    page_type, created_at, accessed_at): no content is read and no ORM
+    instance or identity-map entry is built per page.
+    
+    Pages are ordered by ID, i.e. creation order, and use keyset pagination
+    on the primary key, so any page of results costs one index descent
+    instead of scanning the skipped rows as OFFSET does, and the rowid
+    b-tree serves as both sort order and cursor with no sort step.
     
     Args:
         db: Database session
         page_type: Optional filter by page type ('web' or 'pdf')
-        query_text: Optional search text to filter by title/url (LIKE query)
+        query_text: Optional search text; a pasted URL is prefix-matched against
+            the url index. Otherwise each token of 3+ characters must occur
+            in the title or url (trigram FTS5 index); a query of only
+            shorter tokens is matched as one substring of the title or url
         limit: Maximum number of results to return
-        offset: Number of results to skip
+        after_id: Only return pages with an ID below this cursor
         
     Returns:
-        List of Page instances
+        List of rows with the PageBasicRead columns
     """
-    query = db.query(Page)
+    # Built from cached lambda statements: each combination of filters
+    # compiles once, and the values below become bound parameters
+    stmt = lambda_stmt(lambda: select(
+        Page.id, Page.url, Page.title, Page.page_type, Page.created_at, Page.accessed_at
+    ))
+    params = {}
     
     # Apply filters if provided
     if page_type:
-        query = query.filter(Page.page_type == page_type)
-    
-    if query_text:
-        # Basic LIKE search on title and URL
-        # TODO: Replace with FTS5 for better performance and search quality
-        search_term = f"%{query_text}%"
-        query = query.filter(
-            (Page.title.ilike(search_term)) | 
-            (Page.url.ilike(search_term))
+        stmt += lambda s: s.where(Page.page_type == page_type)
+    
+    query_text = query_text.strip() if query_text else ""
+    if "://" in query_text and not any(c.isspace() for c in query_text):
+        # URL lookup: a range seek on the unique url index, no FTS tokenizing
+        url_upper = query_text + "\U0010ffff"
+        stmt += lambda s: s.where(Page.url >= query_text, Page.url < url_upper)
+    elif match := fts_match_expression(query_text):
+        # Indexed substring lookup instead of a LIKE '%q%' table scan
+        stmt += lambda s: s.where(
+            text("pages.id IN (SELECT rowid FROM pages_fts WHERE pages_fts MATCH :match)")
         )
-    
-    # Order by most recently accessed
-    query = query.order_by(Page.accessed_at.desc().nullslast(), Page.created_at.desc())
-    
-    # Apply pagination
-    return query.offset(offset).limit(limit).all()
+        params["match"] = match
+    elif query_text:
+        # Only 1-2 character tokens: too short for trigrams, scan title/url.
+        # SQLite's LIKE already ignores ASCII case, so no LOWER() wrapping is
+        # needed. Escaped by hand: autoescape needs a literal string, not a
+        # lambda parameter
+        pattern = "%" + query_text.replace("/", "//").replace("%", "/%").replace("_", "/_") + "%"
+        stmt += lambda s: s.where(or_(
+            Page.title.like(pattern, escape="/"),
+            Page.url.like(pattern, escape="/")
+        ))
+    
+    # Apply keyset pagination
+    if after_id is not None:
+        stmt += lambda s: s.where(Page.id < after_id)
+    
+    stmt += lambda s: s.order_by(Page.id.desc()).limit(limit)
+    return db.execute(stmt, params).all()
 
 def update_page(db: Session, page_id: int, page_data: Dict[str, Any]) -> Optional[Page]:
     """
@@ -214,8 +494,9 @@ def update_page(db: Session, page_id: int, page_data: Dict[str, Any]) -> Optiona
             setattr(db_page, key, value)
     
     db.commit()
-    db.refresh(db_page)
-    return db_page
+    # Reload with get_page's eager loaders; a refreshed instance would
+    # lazy-load each relationship separately when serialized
+    return get_page(db, page_id)
 
 def update_page_access(
     db: Session, 
@@ -233,38 +514,72 @@ def update_page_access(
     Returns:
         Updated Page instance, or None if not found
     """
-    db_page = db.query(Page).filter(Page.id == page_id).first()
-    if not db_page:
+    if record_page_access(db, page_id, time_spent_seconds) is None:
         return None
+    return get_page(db, page_id)
+
+def record_page_access(
+    db: Session, 
+    page_id: int, 
+    time_spent_seconds: Optional[int] = None
+) -> Optional[datetime.datetime]:
+    """
+    Record a visit to a page without loading it.
     
-    # Update the accessed_at timestamp
-    current_time = now()
-    db_page.accessed_at = current_time
+    Sets accessed_at, optionally adds to time spent, logs an OPENED history
+    entry and commits; every statement is a Core UPDATE/INSERT, so no Page
+    row is fetched and no ORM instance is built.
+    
+    Args:
+        db: Database session
+        page_id: ID of the page
+        time_spent_seconds: Optional seconds to add to the total time spent
+        
+    Returns:
+        The new accessed_at timestamp, or None if the page doesn't exist
+    """
+    # Update the accessed_at timestamp; no row back means no such page
+    current_time = _touch_page(db, page_id)
+    if current_time is None:
+        return None
     
     # Update time spent if provided
     if time_spent_seconds is not None and time_spent_seconds > 0:
-        db_time_spent = db.query(PageTimeSpent).filter(PageTimeSpent.page_id == page_id).first()
-        
-        if db_time_spent:
-            db_time_spent.total_seconds += time_spent_seconds
-            db_time_spent.last_updated = current_time
-        else:
-            # Create time spent record if it doesn't exist
-            db_time_spent = PageTimeSpent(
-                page_id=page_id,
-                total_seconds=time_spent_seconds,
-                last_updated=current_time
-            )
-            db.add(db_time_spent)
+        _upsert_time_spent(db, page_id, time_spent_seconds)
     
     # Log the access in history
     log_history(db, page_id, HistoryAction.OPENED)
     
     db.commit()
-    db.refresh(db_page)
-    return db_page
+    return current_time
+
+def _touch_page(db: Session, page_id: int) -> Optional[datetime.datetime]:
+    """Set a page's accessed_at with one UPDATE; returns the new value, or None if the page doesn't exist."""
+    stmt = update(Page).where(Page.id == page_id).values(accessed_at=SQL_NOW).returning(Page.accessed_at)
+    return db.execute(stmt).scalar()
 
-def add_time_spent_increment(db: Session, page_id: int, seconds: int) -> Optional[PageTimeSpent]:
+def _upsert_time_spent(db: Session, page_id: int, seconds: int) -> int:
+    """
+    Add seconds to a page's time spent, creating the row if needed, in one statement.
+    
+    Only the new total is returned, so no PageTimeSpent instance is built;
+    callers that need the row reload it after commit.
+    """
+    stmt = (
+        sqlite_insert(PageTimeSpent)
+        .values(page_id=page_id, total_seconds=seconds)
+        .on_conflict_do_update(
+            index_elements=[PageTimeSpent.page_id],
+            set_={
+                "total_seconds": PageTimeSpent.total_seconds + seconds,
+                "last_updated": SQL_NOW
+            }
+        )
+        .returning(PageTimeSpent.total_seconds)
+    )
+    return db.execute(stmt).scalar_one()
+
+def add_time_spent_increment(db: Session, page_id: int, seconds: int) -> Optional[int]:
     """
     Add time spent to a page.
     
@@ -274,41 +589,25 @@ def add_time_spent_increment(db: Session, page_id: int, seconds: int) -> Optiona
         seconds: Seconds to add to the total
         
     Returns:
-        Updated PageTimeSpent instance, or None if page not found
+        The page's new total seconds, or None if page not found
     """
-    # Check if page exists
-    db_page = db.query(Page).filter(Page.id == page_id).first()
-    if not db_page:
+    # Update the page's accessed_at timestamp (this also checks the page exists)
+    if _touch_page(db, page_id) is None:
         return None
     
-    current_time = now()
-    
-    # Update the page's accessed_at timestamp
-    db_page.accessed_at = current_time
-    
-    # Get or create time spent record
-    db_time_spent = db.query(PageTimeSpent).filter(PageTimeSpent.page_id == page_id).first()
-    
-    if db_time_spent:
-        db_time_spent.total_seconds += seconds
-        db_time_spent.last_updated = current_time
-    else:
-        db_time_spent = PageTimeSpent(
-            page_id=page_id,
-            total_seconds=seconds,
-            last_updated=current_time
-        )
-        db.add(db_time_spent)
-    
+    total_seconds = _upsert_time_spent(db, page_id, seconds)
     db.commit()
-    db.refresh(db_time_spent)
-    return db_time_spent
+    return total_seconds
 
 # Image CRUD operations
 def add_images(db: Session, page_id: int, images: List[ImageCreate]) -> List[Image]:
     """
     Add multiple images to a page.
     
+    The rows go in as one batched INSERT ... RETURNING, which hands back
+    the created Image instances (with IDs) in input order without a
+    per-object add/flush through the unit of work.
+    
     Args:
         db: Database session
         page_id: ID of the page to associate images with
@@ -317,19 +616,37 @@ def add_images(db: Session, page_id: int, images: List[ImageCreate]) -> List[Ima
     Returns:
         List of created Image instances
     """
-    db_images = []
-    for image_data in images:
-        db_image = Image(
-            page_id=page_id,
-            image_url=image_data.image_url,
-            alt_text=image_data.alt_text,
-            created_at=now()
-        )
-        db.add(db_image)
-        db_images.append(db_image)
+    rows = _image_rows(page_id, images)
+    if not rows:
+        return []
+    return db.scalars(insert(Image).returning(Image, sort_by_parameter_order=True), rows).all()
+
+def _image_rows(page_id: int, images: List[ImageCreate]) -> List[Dict[str, Any]]:
+    """Build INSERT parameter rows for a page's images; created_at is filled in by SQLite."""
+    return [
+        {
+            "page_id": page_id,
+            "image_url": image_data.image_url,
+            "alt_text": image_data.alt_text
+        }
+        for image_data in images
+    ]
+
+def insert_images(db: Session, page_id: int, images: List[ImageCreate]) -> None:
+    """
+    Bulk-insert images for a page with a single executemany INSERT.
     
-    db.flush()
-    return db_images
+    Unlike add_images, no Image instances are created or returned, so the
+    rows skip the ORM unit of work entirely.
+    
+    Args:
+        db: Database session
+        page_id: ID of the page to associate images with
+        images: List of image data
+    """
+    rows = _image_rows(page_id, images)
+    if rows:
+        db.execute(insert(Image), rows)
 
 def get_page_with_images(db: Session, page_id: int) -> Optional[Page]:
     """
@@ -343,7 +660,7 @@ def get_page_with_images(db: Session, page_id: int) -> Optional[Page]:
         Page instance with images relationship populated, or None if not found
     """
     return db.query(Page).options(
-        joinedload(Page.images)
+        selectinload(Page.images)
     ).filter(Page.id == page_id).first()
 
 # Embedding CRUD operations
@@ -359,19 +676,89 @@ def add_embedding(db: Session, page_id: int, embedding_data: EmbeddingCreate) ->
     Returns:
         Created Embedding instance
     """
-    # Convert the float array to binary blob
-    binary_embedding = float_list_to_bytes(embedding_data.embedding)
+    return add_embedding_vector(db, page_id, embedding_data.model_name, embedding_data.embedding)
+
+def add_embedding_vector(
+    db: Session, 
+    page_id: int, 
+    model_name: str, 
+    vector: Union[List[float], np.ndarray]
+) -> Embedding:
+    """
+    Add an embedding to a page from a float list or an ndarray.
+    
+    An ndarray (e.g. a np.frombuffer view of an octet-stream body) is
+    encoded without ever being converted to Python floats.
     
+    Returns:
+        Created Embedding instance
+    """
+    dtype = settings.EMBEDDING_STORAGE_DTYPE
     db_embedding = Embedding(
         page_id=page_id,
-        embedding=binary_embedding,
-        model_name=embedding_data.model_name,
-        created_at=now()
+        embedding=encode_embedding(vector, dtype),
+        embedding_dtype=dtype,
+        model_name=model_name
     )
     db.add(db_embedding)
     db.flush()
+    if settings.VECTOR_SEARCH_BACKEND == "sqlite-vec":
+        sqlite_vec_store.add(db, db_embedding.id, page_id, model_name, vector)
     return db_embedding
 
+def add_embedding_to_page(
+    db: Session, 
+    page_id: int, 
+    model_name: str, 
+    vector: Union[List[float], np.ndarray]
+) -> Optional[Page]:
+    """
+    Store an embedding for an existing page, commit, and make it searchable.
+    
+    Returns:
+        The page with embedding metadata, or None if the page doesn't exist
+    """
+    # Primary key probe only; the full page is loaded at the end
+    if db.query(Page.id).filter(Page.id == page_id).scalar() is None:
+        return None
+    add_embedding_vector(db, page_id, model_name, vector)
+    db.commit()
+    index_embedding(page_id, vector)
+    return get_page(db, page_id)
+
+def insert_embeddings(db: Session, page_id: int, embeddings: List[EmbeddingCreate]) -> None:
+    """
+    Bulk-insert embeddings for a page with a single executemany INSERT.
+    
+    Args:
+        db: Database session
+        page_id: ID of the page
+        embeddings: Embedding data including vectors and model names
+    """
+    if not embeddings:
+        return
+    dtype = settings.EMBEDDING_STORAGE_DTYPE
+    blobs = encode_embeddings([embedding_data.embedding for embedding_data in embeddings], dtype)
+    rows = [
+        {
+            "page_id": page_id,
+            "embedding": blob,
+            "embedding_dtype": dtype,
+            "model_name": embedding_data.model_name
+        }
+        for embedding_data, blob in zip(embeddings, blobs)
+    ]
+    if settings.VECTOR_SEARCH_BACKEND == "sqlite-vec":
+        # The vec0 rows are keyed by embedding ID, so fetch the IDs in input order
+        ids = db.scalars(
+            insert(Embedding).returning(Embedding.id, sort_by_parameter_order=True), rows
+        ).all()
+        sqlite_vec_store.add_many(
+            db, [(emb_id, page_id, e.model_name, e.embedding) for emb_id, e in zip(ids, embeddings)]
+        )
+    else:
+        db.execute(insert(Embedding), rows)
+
 def get_embedding(db: Session, embedding_id: int) -> Optional[Embedding]:
     """
     Get an embedding by ID.
@@ -383,7 +770,22 @@ def get_embedding(db: Session, embedding_id: int) -> Optional[Embedding]:
     Returns:
         Embedding instance or None if not found
     """
-    return db.query(Embedding).filter(Embedding.id == embedding_id).first()
+    stmt = lambda_stmt(lambda: select(Embedding).options(
+        undefer(Embedding.embedding)
+    ).where(Embedding.id == embedding_id))
+    return db.scalars(stmt).first()
+
+def get_embedding_blob(db: Session, embedding_id: int) -> Optional[Tuple[bytes, str, str]]:
+    """
+    Get an embedding's (blob, dtype, model_name) without building an ORM instance.
+    
+    Returns:
+        The row as a tuple, or None if not found
+    """
+    return db.execute(lambda_stmt(
+        lambda: select(Embedding.embedding, Embedding.embedding_dtype, Embedding.model_name)
+        .where(Embedding.id == embedding_id)
+    )).first()
 
 def get_latest_embedding_by_model(
     db: Session, 
@@ -401,38 +803,99 @@ def get_latest_embedding_by_model(
     Returns:
         Latest Embedding instance or None if not found
     """
-    return db.query(Embedding).filter(
+    stmt = lambda_stmt(lambda: select(Embedding).options(undefer(Embedding.embedding)).where(
         Embedding.page_id == page_id,
         Embedding.model_name == model_name
-    ).order_by(Embedding.created_at.desc()).first()
+    ).order_by(Embedding.created_at.desc()).limit(1))
+    return db.scalars(stmt).first()
 
 
 # --- Definitive, correct semantic_search using table-valued function ---
 def semantic_search(db: Session, query_vector: list[float], top_k: int = 10) -> list[tuple[int, float]]:
-    # Use the global FAISS index for semantic search
-    return faiss_index.search(query_vector, top_k)
+    # Search the configured vector backend; all return (page_id, cosine similarity)
+    return semantic_search_batch(db, [query_vector], top_k)[0]
+
+def semantic_search_batch(
+    db: Session, 
+    query_vectors: Union[List[List[float]], np.ndarray], 
+    top_k: int = 10
+) -> list[list[tuple[int, float]]]:
+    """
+    Search several query vectors at once; returns one result list per query.
+    
+    The FAISS and numpy backends score the whole (B, d) batch with one
+    matrix-matrix product. sqlite-vec runs one KNN query per vector.
+    """
+    if settings.VECTOR_SEARCH_BACKEND == "sqlite-vec":
+        return [sqlite_vec_store.search(db, query_vector, top_k) for query_vector in query_vectors]
+    if settings.VECTOR_SEARCH_BACKEND == "numpy":
+        return embedding_matrix.search_batch(query_vectors, top_k)
+    return faiss_index.search_batch(query_vectors, top_k)
 
 # Efficiently fetch a list of Page objects by IDs
 def get_pages_by_ids(db: Session, page_ids: list[int]) -> list[Page]:
+    """
+    Fetch pages by ID with only the columns used by list/search views.
+    
+    Large columns (content_html, text) are not loaded and no relationships
+    are, so the whole lookup is one IN query; in DEBUG a relationship
+    access raises instead of fanning out into per-page lazy loads. Pages
+    are returned in the order of page_ids (e.g. search rank); missing IDs
+    are skipped.
+    """
     if not page_ids:
         return []
-    return db.query(Page).filter(Page.id.in_(page_ids)).all()
+    query = db.query(Page).options(
+        load_only(
+            Page.id, Page.url, Page.title, Page.page_type,
+            Page.created_at, Page.accessed_at
+        )
+    )
+    if settings.DEBUG:
+        query = query.options(raiseload("*"))
+    pages = query.filter(Page.id.in_(page_ids)).all()
+    order = {page_id: i for i, page_id in enumerate(page_ids)}
+    pages.sort(key=lambda page: order[page.id])
+    return pages
 
-# Efficiently fetch a list of Page objects by IDs
-def get_pages_by_ids(db: Session, page_ids: list[int]) -> list[Page]:
+def get_pages_for_rag(
+    db: Session, 
+    page_ids: list[int], 
+    max_text_chars: int = 2048
+) -> list[Tuple[int, Optional[str], str, Optional[str]]]:
+    """
+    Fetch lightweight (id, title, url, text) rows for building RAG context.
+    
+    Returns plain tuples instead of ORM objects, and truncates text in SQL
+    so only the part used in the prompt is read.
+    
+    Args:
+        db: Database session
+        page_ids: IDs of the pages to fetch
+        max_text_chars: Maximum number of text characters per page
+        
+    Returns:
+        List of (id, title, url, text) tuples in no particular order
+    """
     if not page_ids:
         return []
-    return db.query(Page).filter(Page.id.in_(page_ids)).all()
+    stmt = select(
+        Page.id, Page.title, Page.url, func.substr(Page.text, 1, max_text_chars)
+    ).where(Page.id.in_(page_ids))
+    return [tuple(row) for row in db.execute(stmt)]
 # History CRUD operations
 def log_history(
     db: Session, 
     page_id: int, 
     action: HistoryAction, 
     session_id: Optional[str] = None
-) -> History:
+) -> int:
     """
     Log a history entry for a page.
     
+    History rows are write-only audit records, so they are inserted with a
+    Core INSERT instead of going through the ORM unit of work.
+    
     Args:
         db: Database session
         page_id: ID of the page
@@ -440,43 +903,50 @@ def log_history(
         session_id: Optional session identifier
         
     Returns:
-        Created History instance
+        ID of the created history entry
     """
-    db_history = History(
+    stmt = insert(History).values(
         page_id=page_id,
-        accessed_at=now(),
         action=action,
         session_id=session_id
-    )
-    db.add(db_history)
-    db.flush()
-    return db_history
+    ).returning(History.id)
+    return db.execute(stmt).scalar_one()
 
 def get_history(
     db: Session, 
     page_id: Optional[int] = None, 
     limit: int = 50, 
-    offset: int = 0
-) -> List[History]:
+    after_id: Optional[int] = None
+) -> List[Row]:
     """
-    Get history entries, optionally filtered by page.
+    Get history entries, optionally filtered by page, newest first.
+    
+    Entries are appended as they happen, so ID order matches accessed_at
+    order and the primary key doubles as the pagination cursor. Entries
+    are returned as Core rows, skipping ORM instance construction.
     
     Args:
         db: Database session
         page_id: Optional ID of the page to filter by
         limit: Maximum number of entries to return
-        offset: Number of entries to skip
+        after_id: Only return entries with an ID below this cursor
         
     Returns:
-        List of History instances
+        List of rows with the HistoryRead columns
     """
-    query = db.query(History)
+    # Each combination of optional filters is cached as its own lambda statement
+    stmt = lambda_stmt(lambda: select(
+        History.id, History.page_id, History.accessed_at, History.action, History.session_id
+    ))
     
     if page_id is not None:
-        query = query.filter(History.page_id == page_id)
+        stmt += lambda s: s.where(History.page_id == page_id)
+    
+    if after_id is not None:
+        stmt += lambda s: s.where(History.id < after_id)
     
-    query = query.order_by(History.accessed_at.desc())
-    return query.offset(offset).limit(limit).all()
+    stmt += lambda s: s.order_by(History.id.desc()).limit(limit)
+    return db.execute(stmt).all()
 
 # User CRUD operations
 def create_user(db: Session, name: str, email: Optional[str] = None) -> User:
@@ -488,12 +958,12 @@ def create_user(db: Session, name: str, email: Optional[str] = None) -> User:
         name: User name
         email: Optional email address
     Returns:
-        Created User instance
+        Created User instance (expired by the commit; attributes reload
+        on first access)
     """
     db_user = User(name=name, email=email)
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 def get_user(db: Session, user_id: int) -> Optional[User]:
@@ -507,7 +977,7 @@ def get_user(db: Session, user_id: int) -> Optional[User]:
     Returns:
         User instance or None if not found
     """
-    return db.query(User).filter(User.id == user_id).first()
+    return db.scalars(lambda_stmt(lambda: select(User).where(User.id == user_id))).first()
 
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
     """
@@ -520,4 +990,4 @@ def get_user_by_email(db: Session, email: str) -> Optional[User]:
     Returns:
         User instance or None if not found
     """
-    return db.query(User).filter(User.email == email).first()
\ No newline at end of file
+    return db.scalars(lambda_stmt(lambda: select(User).where(User.email == email))).first()
\ No newline at end of file
@@ -5,6 +5,7 @@ Database connection and session management for Research Board API.
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
 from typing import Generator
 import logging
 import os
@@ -14,11 +15,26 @@ from app.config import settings
 logger = logging.getLogger(__name__)
 
 # --- Database Setup ---
+# Pooled connections keep their PRAGMAs and parsed schema between requests.
+# The pool is sized above FastAPI's 40-thread default so sync routes and
+# offloaded DB work never queue on QueuePool checkout under load.
+if settings.DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+    # An in-memory database lives in a single connection; share it
+    pool_kwargs = {"poolclass": StaticPool}
+else:
+    pool_kwargs = {"pool_size": 20, "max_overflow": 40, "pool_recycle": 3600}
+
 engine: Engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False},
+    pool_pre_ping=True,
+    **pool_kwargs
 )
 
+# journal_mode=WAL is stored in the database file, so it only needs to be
+# switched once per process; later connections inherit it
+_journal_mode_checked = False
+
 # --- Combined Connection Setup ---
 @event.listens_for(engine, "connect")
 def on_connect(dbapi_connection, connection_record):
@@ -26,13 +42,27 @@ def on_connect(dbapi_connection, connection_record):
     Master function to configure each new SQLite connection.
     It enables foreign keys and loads the necessary VSS extensions.
     """
-    logger.info("Setting up new SQLite connection...")
+    logger.debug("Setting up new SQLite connection...")
     
-    # 1. Enable Foreign Key support
+    # 1. Enable Foreign Key support and tune the connection
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+    global _journal_mode_checked
+    if not _journal_mode_checked:
+        # Readers no longer block on writers (or writers on readers)
+        journal_mode = cursor.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if journal_mode.lower() != "wal":
+            # e.g. "memory" for an in-memory database
+            logger.warning("SQLite journal_mode is %s, not WAL", journal_mode)
+        _journal_mode_checked = True
+    # In WAL mode NORMAL syncs only at checkpoints: a power loss can drop the
+    # last few commits, but cannot corrupt the database
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_MB * 1024}")  # negative = KiB
+    cursor.execute("PRAGMA temp_store=MEMORY")  # Sorts and temp indexes stay off disk
     cursor.close()
-    logger.info("Foreign key support enabled.")
+    logger.debug("Foreign key support and connection PRAGMAs enabled.")
     
     # 2. Load vector search extensions
     try:
@@ -47,24 +77,100 @@ def on_connect(dbapi_connection, connection_record):
         # Load vector0, which is a dependency for vss0
         if os.path.exists(vector_path):
             dbapi_connection.load_extension(vector_path)
-            logger.info(f"Loaded SQLite extension: {vector_path}")
+            logger.info("Loaded SQLite extension: %s", vector_path)
         else:
-            logger.warning(f"vector0.dylib not found at {vector_path}")
+            logger.warning("vector0.dylib not found at %s", vector_path)
 
         # Load vss0
         if os.path.exists(vss_path):
             dbapi_connection.load_extension(vss_path)
-            logger.info(f"Loaded SQLite extension: {vss_path}")
+            logger.info("Loaded SQLite extension: %s", vss_path)
         else:
-            logger.warning(f"vss0.dylib not found at {vss_path}")
+            logger.warning("vss0.dylib not found at %s", vss_path)
+            
+        # Load sqlite-vec when it backs semantic search
+        if settings.VECTOR_SEARCH_BACKEND == "sqlite-vec":
+            import sqlite_vec
+            sqlite_vec.load(dbapi_connection)
+            logger.info("Loaded SQLite extension: sqlite-vec")
             
     except Exception as e:
-        logger.error(f"Failed to load sqlite-vss extensions: {e}", exc_info=True)
+        logger.error("Failed to load sqlite-vss extensions: %s", e, exc_info=True)
 
 # --- Session and Model Base Setup ---
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# --- Schema Migrations ---
+# Additive column changes that create_all cannot apply to existing tables:
+# (table, column, column definition)
+COLUMN_MIGRATIONS = [
+    ("embeddings", "embedding_dtype", "VARCHAR(8) NOT NULL DEFAULT 'f32'"),
+    ("pages", "content_hash", "VARCHAR(64)"),
+]
+
+# Indexes that were replaced by a model index covering the same lookups;
+# dropping them saves a b-tree write per INSERT
+OBSOLETE_INDEXES = [
+    "ix_embeddings_page_id",  # leading column of ix_emb_page_model_created
+]
+
+# External-content FTS5 index over page titles and URLs, kept in sync by
+# triggers. The trigram tokenizer indexes every 3-character sequence, so a
+# MATCH finds case-insensitive substrings (the old ILIKE '%q%' semantics)
+# from the index. Page text is not indexed: list search never matches it,
+# and trigram-indexing whole articles made inserts ~24x slower and the
+# database ~5x larger. The update trigger only fires for indexed columns,
+# so access-time and text updates don't rewrite the index.
+FTS_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts "
+    "USING fts5(title, url, content='pages', content_rowid='id', tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS pages_fts_ai AFTER INSERT ON pages BEGIN
+        INSERT INTO pages_fts(rowid, title, url) VALUES (new.id, new.title, new.url);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS pages_fts_ad AFTER DELETE ON pages BEGIN
+        INSERT INTO pages_fts(pages_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS pages_fts_au AFTER UPDATE OF title, url ON pages BEGIN
+        INSERT INTO pages_fts(pages_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+        INSERT INTO pages_fts(rowid, title, url) VALUES (new.id, new.title, new.url);
+    END""",
+]
+
+def run_migrations() -> None:
+    """Apply idempotent schema migrations to an existing database."""
+    with engine.begin() as conn:
+        for table, column, definition in COLUMN_MIGRATIONS:
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                logger.info("Added column %s.%s", table, column)
+        
+        # create_all only builds indexes together with new tables; add any
+        # index declared on the models that an existing table is missing
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        for index_name in OBSOLETE_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index_name}")
+        
+        # Full-text search index; populate it from existing pages on first creation
+        fts_sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'pages_fts'").scalar()
+        fts_columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(pages_fts)")]
+        has_fts = fts_sql is not None and "trigram" in fts_sql and fts_columns == ["title", "url"]
+        if fts_sql is not None and not has_fts:
+            # Built with the word tokenizer or with the text column; replace
+            # it along with its triggers, which name the old columns
+            conn.exec_driver_sql("DROP TABLE pages_fts")
+            for trigger in ("pages_fts_ai", "pages_fts_ad", "pages_fts_au"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+            logger.info("Rebuilding pages_fts as a trigram index over title and url")
+        for statement in FTS_SCHEMA:
+            conn.exec_driver_sql(statement)
+        if not has_fts:
+            conn.exec_driver_sql("INSERT INTO pages_fts(pages_fts) VALUES ('rebuild')")
+            logger.info("Built full-text index pages_fts")
+
 # --- Database Session Dependency ---
 def get_db() -> Generator[Session, None, None]:
     """Dependency for FastAPI to get a database session."""
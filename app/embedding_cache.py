@@ -0,0 +1,87 @@
+"""
+Embedding cache for the Research Board application.
+
+Embeddings are looked up by a SHA-256 digest of the model name and the
+whitespace-normalized text, first in an in-process LRU map and then in the
+``embedding_cache`` SQLite table. Only misses are sent to Ollama.
+"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert
+
+from app.db.database import SessionLocal
+from app.models.models import EmbeddingCacheEntry
+from app.ollama_client import EMBEDDING_MODEL, get_embedding
+
+logger = logging.getLogger(__name__)
+
+MAX_MEMORY_ENTRIES = 4096
+
+_memory_cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+
+
+def cache_key(text: str) -> bytes:
+    """Build the cache key for a text: sha256 of the model and normalized text."""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{EMBEDDING_MODEL}|{normalized}".encode("utf-8")).digest()
+
+
+def _remember(key: bytes, vector: List[float]) -> None:
+    """Insert a vector into the in-memory LRU, evicting the oldest entry if full."""
+    _memory_cache[key] = vector
+    _memory_cache.move_to_end(key)
+    if len(_memory_cache) > MAX_MEMORY_ENTRIES:
+        _memory_cache.popitem(last=False)
+
+
+def _load(key: bytes) -> Optional[bytes]:
+    """Fetch a cached vector blob from SQLite."""
+    with SessionLocal() as db:
+        return db.query(EmbeddingCacheEntry.vector).filter(EmbeddingCacheEntry.key == key).scalar()
+
+
+def _store(key: bytes, vector: List[float]) -> None:
+    """Persist a vector to SQLite, keeping any existing entry for the key."""
+    with SessionLocal() as db:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        db.execute(insert(EmbeddingCacheEntry).values(key=key, vector=blob).on_conflict_do_nothing())
+        db.commit()
+
+
+async def cached_embedding(text: str) -> List[float]:
+    """
+    Return the embedding for a text, calling Ollama only on a cache miss.
+
+    Args:
+        text: Text to embed
+
+    Returns:
+        Embedding vector as a list of floats (empty if generation failed)
+    """
+    key = cache_key(text)
+
+    vector = _memory_cache.get(key)
+    if vector is not None:
+        _memory_cache.move_to_end(key)
+        return vector
+
+    # SQLite calls are blocking, so run them in a worker thread
+    blob = await asyncio.to_thread(_load, key)
+    if blob is not None:
+        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+        _remember(key, vector)
+        return vector
+
+    vector = await get_embedding(text)
+    if not vector:
+        return vector
+
+    await asyncio.to_thread(_store, key, vector)
+    _remember(key, vector)
+    return vector
@@ -0,0 +1,44 @@
+"""
+Similarity kernels for scanning embeddings in Python.
+
+``dot_rows_int8`` scores a query against the int8 rows of the numpy
+backend's quantized matrix. When Numba is installed it is JIT-compiled so
+dequantization is fused into the dot product in a single pass over memory;
+otherwise it falls back to block-wise NumPy dequantization and SGEMV.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:  # pragma: no cover - depends on the environment
+    HAVE_NUMBA = False
+
+# Rows dequantized per step by the NumPy int8 fallback; bounds the temporary
+INT8_SCAN_BLOCK = 65536
+
+
+if HAVE_NUMBA:
+
+    @njit(cache=True, fastmath=True, parallel=True)
+    def dot_rows_int8(M: np.ndarray, scales: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """Dot product of q with each int8 row of M, rescaled by scales[i]."""
+        out = np.empty(M.shape[0], dtype=np.float32)
+        for i in prange(M.shape[0]):
+            s = 0.0
+            for j in range(M.shape[1]):
+                s += M[i, j] * q[j]
+            out[i] = s * scales[i]
+        return out
+
+else:
+
+    def dot_rows_int8(M: np.ndarray, scales: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """Dot product of q with each int8 row of M, rescaled by scales[i]."""
+        # NumPy has no int8 BLAS kernel, so dequantize block-wise into SGEMV
+        out = np.empty(M.shape[0], dtype=np.float32)
+        for start in range(0, M.shape[0], INT8_SCAN_BLOCK):
+            end = start + INT8_SCAN_BLOCK
+            out[start:end] = (M[start:end].astype(np.float32) @ q) * scales[start:end]
+        return out
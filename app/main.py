@@ -7,23 +7,31 @@ routers, and essential endpoints for the research assistant.
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 import logging
+import multiprocessing
 from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
 
 from app.config import settings
-from app.db.database import engine, Base
+from app.db.database import engine, Base, run_migrations
 from sqlalchemy import text
 
 from app.api.routes import router as api_router
+from app.ollama_client import close_http_client
+from app.search_batcher import search_batcher
 
 import app.crud as crud
 import os
-from app.vector_store import faiss_index
+from app.vector_store import faiss_index, faiss_simd_level
+import app.sqlite_vec_store as sqlite_vec_store
+from app.matrix_store import embedding_matrix
+import faiss
 
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 
@@ -36,23 +44,64 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up Research Board backend...")
     Base.metadata.create_all(bind=engine)
+    run_migrations()
     logger.info("Database tables created successfully")
 
-    # Create/load FAISS index
+    # HTML extraction is CPU-bound and holds the GIL; parse in worker processes.
+    # Spawned rather than forked: by the first /collect this process runs
+    # OpenMP and thread-pool threads whose held locks a fork would copy, and
+    # a forked child would also inherit the loaded index and matrix.
+    app.state.html_pool = ProcessPoolExecutor(
+        max_workers=min(settings.HTML_POOL_WORKERS, os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+    # Report which FAISS kernels are in use; a generic build is several times slower
+    simd_level = faiss_simd_level()
+    if simd_level:
+        logger.info("FAISS SIMD dispatch level: %s", simd_level)
+    else:
+        logger.warning(
+            "FAISS was built without SIMD kernels; install the faiss-cpu wheel "
+            "for AVX2/AVX-512 support"
+        )
+
+    # Create/load FAISS index (or sync the sqlite-vec table)
     from sqlalchemy.orm import Session
     session = Session(bind=engine)
-    if os.path.exists(faiss_index.index_path):
-        logger.info(f"Loading FAISS index from {faiss_index.index_path}")
-        faiss_index.load_index()
+    if settings.VECTOR_SEARCH_BACKEND != "sqlite-vec":
+        # Without the extension loaded, its delete trigger would break DELETEs
+        sqlite_vec_store.drop_trigger(session)
+    if settings.VECTOR_SEARCH_BACKEND == "sqlite-vec":
+        logger.info("Using sqlite-vec for semantic search; syncing vector table...")
+        sqlite_vec_store.ensure_table(session)
+    elif settings.VECTOR_SEARCH_BACKEND == "numpy":
+        logger.info("Using exact matrix scan for semantic search; loading embeddings...")
+        if embedding_matrix.load(crud.embeddings_fingerprint(session)):
+            logger.info("Embedding matrix memory-mapped from %s.npy", embedding_matrix.cache_path)
+        else:
+            embedding_matrix.build_from_db(session)
+    elif os.path.exists(faiss_index.index_path):
+        logger.info("Loading FAISS index from %s", faiss_index.index_path)
+        faiss_index.load_index(mmap=settings.FAISS_INDEX_MMAP)
+        logger.info(
+            "FAISS index loaded: %d vectors, mmap=%s, GPUs=%d",
+            faiss_index.index.ntotal, faiss_index.mmapped, faiss.get_num_gpus()
+        )
+        if faiss_index.needs_rebuild():
+            # The file was saved when the corpus was smaller (or under other settings)
+            logger.info("FAISS index type does not suit its size; rebuilding from the database...")
+            faiss_index.build_from_db(session)
+            faiss_index.save_index()
     else:
         logger.info("Building FAISS index from database embeddings...")
-        all_embeddings = crud.get_all_embeddings(session)
-        if all_embeddings:
-            faiss_index.index.reset()
-            for page_id, vector in all_embeddings:
-                faiss_index.add(page_id, vector)
+        faiss_index.build_from_db(session)
+        if faiss_index.index.ntotal:
             faiss_index.save_index()
-            logger.info("FAISS index built and saved.")
+            logger.info(
+                "FAISS index built and saved (%s).",
+                type(faiss.downcast_index(faiss_index.index.index)).__name__
+            )
         else:
             logger.info("No embeddings found in database; FAISS index is empty.")
     session.close()
@@ -61,6 +110,14 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down Research Board backend...")
+    await close_http_client()
+    await search_batcher.close()
+    if settings.VECTOR_SEARCH_BACKEND == "numpy":
+        # Every embedding added while running went through index_embedding,
+        # so the matrix mirrors the table as it is now
+        with Session(bind=engine) as session:
+            embedding_matrix.save(crud.embeddings_fingerprint(session))
+    app.state.html_pool.shutdown(wait=False, cancel_futures=True)
 
 
 # Create FastAPI application
@@ -70,6 +127,7 @@ app = FastAPI(
     version=settings.API_VERSION,
     docs_url=f"{settings.API_PREFIX}/docs",
     redoc_url=f"{settings.API_PREFIX}/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -88,6 +146,9 @@ app.add_middleware(
 )
 
 
+# Compress responses for clients that send Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
@@ -124,8 +185,8 @@ async def health_check():
             "version": settings.API_VERSION
         }
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return JSONResponse(
+        logger.error("Health check failed: %s", e)
+        return ORJSONResponse(
             status_code=503,
             content={
                 "status": "unhealthy",
@@ -0,0 +1,296 @@
+"""
+Exact vector search over an in-memory embedding matrix.
+
+Used when ``VECTOR_SEARCH_BACKEND = "numpy"``. Every stored embedding is
+decoded once into a contiguous, L2-normalized (N, d) float32 matrix, so a
+query costs one BLAS matrix-vector product plus a partial top-k selection
+instead of a per-row Python loop. With ``EMBEDDING_MATRIX_DTYPE = "int8"``
+the rows are kept as int8 codes with one float32 scale each and scanned
+with ``fastmath.dot_rows_int8``, which fuses dequantization into the dot
+product when Numba is available. With ``EMBEDDING_MATRIX_GPU`` a float32
+matrix of at least GPU_MIN_ROWS rows is mirrored to the GPU once and
+scanned with CuPy/cuBLAS; the CPU path remains the fallback.
+"""
+
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.fastmath import dot_rows_int8
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row in place; zero rows are left as zeros."""
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+    matrix /= np.maximum(norms, 1e-12)[:, None]
+    return matrix
+
+
+def _quantize_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization; returns (codes, scales)."""
+    scales = np.abs(matrix).max(axis=1, initial=0.0) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _save_atomic(path: str, array: np.ndarray):
+    """
+    np.save via a temporary file and rename.
+
+    The live matrix may be a memmap of ``path``; truncating that file in
+    place would invalidate the mapping while it is being read.
+    """
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def _load_cupy():
+    """Import CuPy if it is installed and a CUDA device is present, else return None."""
+    try:
+        import cupy
+        if cupy.cuda.runtime.getDeviceCount() > 0:
+            return cupy
+    except Exception as e:  # ImportError, or CUDA driver/runtime errors
+        logger.warning("GPU scan unavailable, using the CPU: %s", e)
+    return None
+
+
+def _top_k(sims: np.ndarray, page_ids: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+    """Return the top_k (page_id, similarity) pairs of one row of scores, best first."""
+    n = sims.shape[0]
+    if top_k < n:
+        # O(N) selection of the top_k, then sort only those. Partitioning
+        # at n - top_k avoids allocating a negated copy of sims.
+        top = np.argpartition(sims, n - top_k)[n - top_k:]
+        order = top[np.argsort(sims[top])[::-1]]
+    else:
+        order = np.argsort(sims)[::-1]
+    return list(zip(page_ids[order].tolist(), sims[order].tolist()))
+
+
+# Below this many rows the GEMV is too short to repay the launch and copy-back
+GPU_MIN_ROWS = 50000
+
+
+class EmbeddingMatrix:
+    def __init__(self, dimension: int, cache_path: str, dtype: str = "f32", use_gpu: bool = False):
+        self.dimension = dimension
+        self.cache_path = cache_path
+        self.dtype = dtype
+        self.use_gpu = use_gpu and dtype == "f32"
+        self._cupy = None
+        # (host matrix, device copy): the copy is valid while the host matrix is current
+        self._device: Optional[tuple] = None
+        self.matrix = np.empty((0, dimension), dtype=np.int8 if dtype == "int8" else np.float32)
+        self.scales = np.empty(0, dtype=np.float32)
+        self.page_ids = np.empty(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def _encode(self, matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Convert normalized float32 rows to the configured in-memory format."""
+        if self.dtype == "int8":
+            return _quantize_rows(matrix)
+        return matrix, np.ones(matrix.shape[0], dtype=np.float32)
+
+    def rebuild(self, items: List[Tuple[int, List[float]]]):
+        """Replace the matrix contents with the given (page_id, vector) pairs."""
+        matrix = np.empty((len(items), self.dimension), dtype=np.float32)
+        for row, (_, vector) in enumerate(items):
+            matrix[row] = vector
+        page_ids = np.fromiter((page_id for page_id, _ in items), dtype=np.int64, count=len(items))
+        self._replace(matrix, page_ids)
+
+    def _replace(self, matrix: np.ndarray, page_ids: np.ndarray):
+        """Normalize, encode and install a float32 matrix with its page IDs."""
+        matrix, scales = self._encode(_normalize_rows(matrix))
+        self._install(matrix, scales, page_ids)
+
+    def _install(self, matrix: np.ndarray, scales: np.ndarray, page_ids: np.ndarray):
+        """Swap in an encoded matrix; searches in flight keep the arrays they started with."""
+        with self._lock:
+            self.matrix = matrix
+            self.scales = scales
+            self.page_ids = page_ids
+            self._device = None
+
+    def build_from_db(self, db_session):
+        """
+        Build the matrix from all embeddings in the database and persist it.
+
+        Rows are streamed by crud.iter_embedding_chunks, normalized and
+        encoded a chunk at a time, and written into a file-backed .npy
+        memmap of the in-memory dtype, sized by a COUNT(*) up front. Neither
+        the result set nor a float32 copy of an int8 matrix is ever
+        materialized, and the filled memmap becomes the cache file itself.
+        The table's fingerprint, taken before streaming, is saved with it.
+        """
+        from app.crud import embeddings_fingerprint, iter_embedding_chunks
+        fingerprint = embeddings_fingerprint(db_session)
+        total = fingerprint[0]
+        if total == 0:
+            self.rebuild([])
+            self.save(fingerprint)
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        build_file = f"{self.cache_path}.build.npy"
+        matrix = np.lib.format.open_memmap(
+            build_file, mode="w+", dtype=self.matrix.dtype, shape=(total, self.dimension)
+        )
+        scales = np.empty(total, dtype=np.float32)
+        page_ids = np.empty(total, dtype=np.int64)
+        filled = 0
+        for chunk_ids, chunk_matrix in iter_embedding_chunks(db_session, self.dimension):
+            # Rows added since the COUNT can't fit; the next rebuild picks them up
+            end = min(filled + chunk_ids.shape[0], total)
+            # np.array: decoded chunks may be read-only views of the blobs
+            rows, row_scales = self._encode(_normalize_rows(np.array(chunk_matrix[:end - filled])))
+            matrix[filled:end] = rows
+            scales[filled:end] = row_scales
+            page_ids[filled:end] = chunk_ids[:end - filled]
+            filled = end
+        self._install(matrix[:filled], scales[:filled], page_ids[:filled])
+        matrix_file, ids_file, scales_file, fingerprint_file = self._cache_files()
+        if filled == total:
+            # The encoded rows were written in place; publish the file as the cache
+            matrix.flush()
+            os.replace(build_file, matrix_file)
+            _save_atomic(ids_file, self.page_ids)
+            _save_atomic(scales_file, self.scales)
+            _save_atomic(fingerprint_file, np.array(fingerprint, dtype=np.int64))
+        else:
+            # Save the trimmed matrix instead; on POSIX an unlinked file stays
+            # readable while it is still mapped
+            self.save(fingerprint)
+            os.remove(build_file)
+        logger.info("Embedding matrix built: %d x %d", filled, self.dimension)
+
+    def _cache_files(self) -> Tuple[str, str, str, str]:
+        return (
+            f"{self.cache_path}.npy", f"{self.cache_path}_ids.npy",
+            f"{self.cache_path}_scales.npy", f"{self.cache_path}_fingerprint.npy"
+        )
+
+    def save(self, fingerprint: Tuple[int, int]):
+        """
+        Persist the matrix, page IDs and scales as .npy files for warm starts.
+
+        fingerprint is crud.embeddings_fingerprint of the table the matrix
+        currently mirrors; load() only accepts the cache while it still matches.
+        """
+        with self._lock:
+            matrix, scales, page_ids = self.matrix, self.scales, self.page_ids
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        matrix_file, ids_file, scales_file, fingerprint_file = self._cache_files()
+        _save_atomic(matrix_file, matrix)
+        _save_atomic(ids_file, page_ids)
+        _save_atomic(scales_file, scales)
+        # Written last, so an interrupted save leaves a stale fingerprint and a rebuild
+        _save_atomic(fingerprint_file, np.array(fingerprint, dtype=np.int64))
+
+    def load(self, fingerprint: Tuple[int, int]) -> bool:
+        """
+        Memory-map a saved matrix if it was saved with this table fingerprint.
+
+        The fingerprint (see crud.embeddings_fingerprint) is compared rather
+        than the row count: rows of another dimension are left out of the
+        matrix, and a delete plus an insert keeps the count unchanged.
+        Returns False (leaving the matrix untouched) when there is no usable
+        cache, in which case the caller should rebuild from the database.
+        """
+        files = self._cache_files()
+        if not all(os.path.exists(path) for path in files):
+            return False
+        if tuple(np.load(files[3]).tolist()) != tuple(fingerprint):
+            return False
+        matrix = np.load(files[0], mmap_mode="r")
+        expected_dtype = np.int8 if self.dtype == "int8" else np.float32
+        if matrix.shape[1:] != (self.dimension,) or matrix.dtype != expected_dtype:
+            return False
+        page_ids = np.load(files[1])
+        scales = np.load(files[2])
+        with self._lock:
+            self.matrix = matrix
+            self.scales = scales
+            self.page_ids = page_ids
+            self._device = None
+        return True
+
+    def add(self, page_id: int, vector: List[float]):
+        """Append a new vector to the matrix."""
+        row, scale = self._encode(_normalize_rows(np.array(vector, dtype=np.float32).reshape(1, -1)))
+        with self._lock:
+            previous = self.matrix
+            self.matrix = np.concatenate([previous, row])
+            self.scales = np.concatenate([self.scales, scale])
+            self.page_ids = np.append(self.page_ids, page_id)
+            if self._device is not None and self._device[0] is previous:
+                # Append on the device too instead of re-uploading the matrix
+                cp = self._cupy
+                self._device = (self.matrix, cp.concatenate([self._device[1], cp.asarray(row)]))
+            else:
+                self._device = None
+
+    def _device_matrix(self, matrix: np.ndarray):
+        """Return the GPU copy of a float32 matrix, uploading it on first use."""
+        if self._cupy is None:
+            self._cupy = _load_cupy()
+            if self._cupy is None:
+                self.use_gpu = False
+                return None
+        with self._lock:
+            if self._device is not None and self._device[0] is matrix:
+                return self._device[1]
+        device_matrix = self._cupy.asarray(matrix)
+        with self._lock:
+            if self.matrix is matrix:
+                self._device = (matrix, device_matrix)
+        logger.info("Embedding matrix uploaded to GPU: %d x %d", matrix.shape[0], matrix.shape[1])
+        return device_matrix
+
+    def search(self, query_vector: List[float], top_k: int = 5) -> List[Tuple[int, float]]:
+        """Search for the top_k most similar vectors. Returns (page_id, cosine similarity) tuples."""
+        return self.search_batch([query_vector], top_k)[0]
+
+    def search_batch(self, query_vectors, top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """
+        Search several query vectors with one pass over the matrix.
+
+        For a float32 matrix the B normalized queries are stacked and scored
+        with a single (B, d) x (d, N) product, so the matrix is streamed from
+        memory once per batch instead of once per query. Returns one list of
+        (page_id, cosine similarity) tuples per query.
+        """
+        q = np.array(query_vectors, dtype=np.float32).reshape(-1, self.dimension)
+        q /= np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            matrix, scales, page_ids = self.matrix, self.scales, self.page_ids
+        if matrix.shape[0] == 0 or top_k <= 0:
+            return [[] for _ in range(q.shape[0])]
+        if matrix.dtype == np.int8:
+            # asarray drops the np.memmap subclass so the kernel sees a plain array
+            sims = np.stack([dot_rows_int8(np.asarray(matrix), scales, row) for row in q])
+        elif self.use_gpu and matrix.shape[0] >= GPU_MIN_ROWS and (
+            device_matrix := self._device_matrix(matrix)
+        ) is not None:
+            cp = self._cupy
+            sims = cp.asnumpy(cp.asarray(q) @ device_matrix.T)
+        else:
+            sims = q @ matrix.T
+        return [_top_k(row, page_ids, top_k) for row in sims]
+
+
+# Global shared embedding matrix instance
+embedding_matrix = EmbeddingMatrix(
+    dimension=768,
+    cache_path="data/embedding_matrix",
+    dtype=settings.EMBEDDING_MATRIX_DTYPE,
+    use_gpu=settings.EMBEDDING_MATRIX_GPU
+)
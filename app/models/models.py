@@ -5,8 +5,8 @@ This module defines SQLAlchemy models for storing web pages, highlights,
 browsing history, and related data for the research assistant.
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, CheckConstraint, LargeBinary
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, CheckConstraint, LargeBinary, Index, text
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 import datetime
 from typing import Optional, List
@@ -17,6 +17,11 @@ def now() -> datetime.datetime:
     """Return current UTC timestamp for consistent datetime handling."""
     return datetime.datetime.utcnow()
 
+# SQL-side counterpart of now(): SQLite evaluates it inside the statement, so
+# inserts bind no datetime parameter. The format matches the text SQLAlchemy
+# stores for Python datetimes, keeping the column consistently comparable.
+SQL_NOW = text("(strftime('%Y-%m-%d %H:%M:%f', 'now') || '000')")
+
 class User(Base):
     """User model for authentication and personalization."""
     __tablename__ = "users"
@@ -38,7 +43,8 @@ class Page(Base):
     text = Column(Text, nullable=True)  # Cleaned plain text from content processor
     highlight = Column(Text, nullable=True)  # Single highlight, TODO: create separate table for multiple highlights
     page_type = Column(String(10), nullable=False)  # 'web' or 'pdf'
-    created_at = Column(DateTime, default=now, nullable=False)
+    content_hash = Column(String(64), nullable=True)  # BLAKE3 of the extracted text, for dedup
+    created_at = Column(DateTime, default=SQL_NOW, server_default=SQL_NOW, nullable=False)
     accessed_at = Column(DateTime, nullable=True)
     
     # Relationships
@@ -50,6 +56,10 @@ class Page(Base):
     
     __table_args__ = (
         CheckConstraint("page_type IN ('web', 'pdf')", name="valid_page_type"),
+        # Serves list_pages' page_type filter; SQLite appends the rowid, so
+        # the keyset ORDER BY id DESC is read straight from the index
+        Index("ix_pages_page_type", "page_type"),
+        Index("ix_pages_content_hash", "content_hash"),
     )
 
 class Image(Base):
@@ -60,7 +70,7 @@ class Image(Base):
     page_id = Column(Integer, ForeignKey("pages.id", ondelete="CASCADE"), nullable=False)
     image_url = Column(Text, nullable=False)
     alt_text = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=now, nullable=False)
+    created_at = Column(DateTime, default=SQL_NOW, server_default=SQL_NOW, nullable=False)
     
     page = relationship("Page", back_populates="images")
 
@@ -81,12 +91,22 @@ class Embedding(Base):
     __tablename__ = "embeddings"
     
     id = Column(Integer, primary_key=True)
-    page_id = Column(Integer, ForeignKey("pages.id", ondelete="CASCADE"), nullable=False, index=True)
-    embedding = Column(LargeBinary, nullable=False)  # Store as float32 vector
+    # Indexed through the leading column of ix_emb_page_model_created
+    page_id = Column(Integer, ForeignKey("pages.id", ondelete="CASCADE"), nullable=False)
+    # float32 vector, float16 for 'f16', or scale + int8 codes for 'sq8'.
+    # Deferred: entity loads skip the blob unless a query undefers it
+    embedding = deferred(Column(LargeBinary, nullable=False))
+    embedding_dtype = Column(String(8), default="f32", server_default="f32", nullable=False)  # 'f32', 'f16' or 'sq8'
     model_name = Column(String(100), nullable=False)
-    created_at = Column(DateTime, default=now, nullable=False)
+    created_at = Column(DateTime, default=SQL_NOW, server_default=SQL_NOW, nullable=False)
     
     page = relationship("Page", back_populates="embeddings")
+    
+    __table_args__ = (
+        # get_latest_embedding_by_model: seek to (page_id, model_name) and
+        # take the first row in created_at order, with no sort step
+        Index("ix_emb_page_model_created", "page_id", "model_name", created_at.desc()),
+    )
 
 class PageTimeSpent(Base):
     """Track time spent on each page."""
@@ -95,7 +115,7 @@ class PageTimeSpent(Base):
     id = Column(Integer, primary_key=True)
     page_id = Column(Integer, ForeignKey("pages.id", ondelete="CASCADE"), nullable=False, unique=True)
     total_seconds = Column(Integer, default=0, nullable=False)
-    last_updated = Column(DateTime, default=now, nullable=False)
+    last_updated = Column(DateTime, default=SQL_NOW, server_default=SQL_NOW, nullable=False)
     
     page = relationship("Page", back_populates="time_spent")
 
@@ -105,8 +125,15 @@ class History(Base):
     
     id = Column(Integer, primary_key=True)
     page_id = Column(Integer, ForeignKey("pages.id", ondelete="CASCADE"), nullable=False, index=True)
-    accessed_at = Column(DateTime, default=now, nullable=False)
+    accessed_at = Column(DateTime, default=SQL_NOW, server_default=SQL_NOW, nullable=False)
     action = Column(String(20), nullable=False)  # 'opened', 'closed', 'highlighted'
     session_id = Column(String(100), nullable=True)
     
     page = relationship("Page", back_populates="history_entries")
+
+class EmbeddingCacheEntry(Base):
+    """Cached embedding vectors keyed by a hash of the normalized input text."""
+    __tablename__ = "embedding_cache"
+    
+    key = Column(LargeBinary, primary_key=True)  # sha256 digest of model + normalized text
+    vector = Column(LargeBinary, nullable=False)  # Store as float32 vector
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+One-off migration: rewrite stored embeddings as L2-normalized vectors.
+
+New embeddings are normalized on write (see ``crud.encode_embeddings``);
+this brings rows written before that change into the same form. Rows are
+processed in primary-key batches and re-encoded in their existing storage
+dtype, so it is safe to run again.
+
+Usage (from the project root):
+    python -m app.normalize_embeddings
+"""
+
+import logging
+
+from sqlalchemy import bindparam, select, update
+
+from app.crud import decode_embedding, encode_embeddings
+from app.db.database import SessionLocal
+from app.models.models import Embedding
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def normalize_stored_embeddings(batch_size: int = BATCH_SIZE) -> int:
+    """Re-encode every stored embedding as a unit vector; returns the number of rows rewritten."""
+    db = SessionLocal()
+    rewritten = 0
+    last_id = 0
+    try:
+        while True:
+            rows = db.execute(
+                select(Embedding.id, Embedding.embedding, Embedding.embedding_dtype)
+                .where(Embedding.id > last_id)
+                .order_by(Embedding.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            params = [
+                {"emb_id": emb_id, "blob": encode_embeddings([decode_embedding(blob, dtype)], dtype)[0]}
+                for emb_id, blob, dtype in rows
+            ]
+            # One executemany UPDATE per batch
+            table = Embedding.__table__
+            db.connection().execute(
+                update(table).where(table.c.id == bindparam("emb_id")).values(embedding=bindparam("blob")),
+                params
+            )
+            db.commit()
+            rewritten += len(rows)
+            last_id = rows[-1][0]
+            logger.info("Normalized %d embeddings", rewritten)
+    finally:
+        db.close()
+    return rewritten
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    count = normalize_stored_embeddings()
+    print(f"Rewrote {count} embeddings as unit vectors.")
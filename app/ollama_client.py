@@ -0,0 +1,172 @@
+"""
+Ollama client helpers for the Research Board application.
+
+This module owns the shared HTTP client used to talk to the local Ollama
+server and exposes embedding and chat helpers. Single-text embedding
+requests are coalesced by a micro-batcher into one /api/embed call.
+"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = "http://127.0.0.1:11434"
+EMBEDDING_MODEL = "embeddinggemma:latest"
+CHAT_MODEL = "gpt-oss:20b"
+MAX_CHAT_CACHE_ENTRIES = 256
+
+# Shared Ollama HTTP client so connections are pooled across requests
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Exact-match cache of chat responses: sha256(model|prompt) -> Ollama JSON
+_chat_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared Ollama HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            timeout=60.0
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Stop the embedding batcher and close the shared Ollama HTTP client."""
+    global _http_client
+    await _batcher.close()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """Generate embeddings for several texts in a single /api/embed call."""
+    if not texts:
+        return []
+    logger.info("Generating %d embedding(s)...", len(texts))
+    url = f"{OLLAMA_BASE_URL}/api/embed"
+    payload = {"model": EMBEDDING_MODEL, "input": texts}
+    response = await get_http_client().post(url, json=payload)
+    response.raise_for_status()
+    embeddings = response.json().get("embeddings", [])
+    if len(embeddings) != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings from Ollama, got {len(embeddings)}")
+    return embeddings
+
+
+class EmbeddingBatcher:
+    """
+    Coalesce concurrent single-text embedding requests into batched calls.
+
+    Requests are collected for up to ``max_wait`` seconds or until
+    ``max_batch_size`` texts are queued, then sent as one request and each
+    caller's future is resolved with its own vector.
+    """
+
+    def __init__(self, max_batch_size: int = 16, max_wait: float = 0.01):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def embed(self, text: str) -> List[float]:
+        """Queue a text for embedding and wait for its vector."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def close(self) -> None:
+        """Cancel the background worker, if running."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._queue = None
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for the first request, then gather more until full or timed out."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            try:
+                vectors = await get_embeddings([text for text, _ in batch])
+            except Exception as e:
+                logger.error("Batched embedding request failed: %s", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+
+_batcher = EmbeddingBatcher()
+
+
+async def get_embedding(text: str) -> List[float]:
+    """Generate an embedding for a single text via the shared micro-batcher."""
+    embedding = await _batcher.embed(text)
+    logger.debug("Embedding received. First 5 values: %s", embedding[:5])
+    return embedding
+
+
+async def chat_completion(prompt: str, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Send a single-message chat request to Ollama and return its JSON response.
+
+    Identical (model, prompt) pairs are answered from an in-memory LRU cache
+    unless use_cache is False, in which case a fresh answer is fetched and
+    stored.
+    """
+    key = hashlib.sha256(f"{CHAT_MODEL}|{prompt}".encode("utf-8")).digest()
+    if use_cache:
+        cached = _chat_cache.get(key)
+        if cached is not None:
+            _chat_cache.move_to_end(key)
+            logger.info("Chat response served from cache")
+            return cached
+
+    url = f"{OLLAMA_BASE_URL}/api/chat"
+    payload = {
+        "model": CHAT_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": False
+    }
+    response = await get_http_client().post(url, json=payload)
+    response.raise_for_status()
+    data = response.json()
+
+    _chat_cache[key] = data
+    _chat_cache.move_to_end(key)
+    if len(_chat_cache) > MAX_CHAT_CACHE_ENTRIES:
+        _chat_cache.popitem(last=False)
+    return data
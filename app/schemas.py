@@ -1,9 +1,3 @@
-from pydantic import BaseModel, Field, HttpUrl, constr, validator
-
-# --- RAG Chat Request Schema ---
-
-class ChatRequest(BaseModel):
-    query: str
 """
 Pydantic schemas for API request and response validation.
 
@@ -11,7 +5,7 @@ This module defines the data models used for API input/output validation
 using Pydantic's data validation system.
 """
 
-from pydantic import BaseModel, Field, HttpUrl, constr, validator
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, constr, model_validator
 from typing import List, Optional, Union, Dict, Any
 import datetime
 from enum import Enum
@@ -30,6 +24,13 @@ class HistoryAction(str, Enum):
     HIGHLIGHTED = "highlighted"
 
 
+# --- RAG Chat Request Schema ---
+
+class ChatRequest(BaseModel):
+    query: str
+    use_cache: bool = True  # Set False to bypass the cached answer and refresh it
+
+
 # Base schemas
 class ImageBase(BaseModel):
     """Base schema for image data."""
@@ -47,7 +48,7 @@ class PDFBase(BaseModel):
 class EmbeddingBase(BaseModel):
     """Base schema for embedding vectors."""
     model_name: str
-    embedding: List[float]
+    embedding: list[float]
     
     model_config = {"protected_namespaces": ()}
 
@@ -95,6 +96,7 @@ class PageCreate(BaseModel):
     text: Optional[str] = None
     highlight: Optional[str] = None
     page_type: PageType
+    content_hash: Optional[str] = None
     images: Optional[List[ImageCreate]] = None
     pdf: Optional[PDFCreate] = None
     embeddings: Optional[List[EmbeddingCreate]] = None
@@ -117,9 +119,7 @@ class ImageRead(ImageBase):
     page_id: int
     created_at: datetime.datetime
     
-    class Config:
-        """Pydantic configuration."""
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PDFRead(PDFBase):
@@ -127,9 +127,7 @@ class PDFRead(PDFBase):
     id: int
     page_id: int
     
-    class Config:
-        """Pydantic configuration."""
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class EmbeddingMetadataRead(BaseModel):
@@ -138,14 +136,45 @@ class EmbeddingMetadataRead(BaseModel):
     model_name: str
     created_at: datetime.datetime
     
-    class Config:
-        """Pydantic configuration."""
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class EmbeddingFullRead(EmbeddingMetadataRead):
     """Schema for reading complete embedding data (with vector)."""
-    embedding: List[float]
+    embedding: list[float]
+
+    @model_validator(mode="before")
+    @classmethod
+    def decode_blob(cls, data: Any) -> Any:
+        """Decode the stored blob of an ORM Embedding into a float list."""
+        if isinstance(getattr(data, "embedding", None), bytes):
+            from app.crud import decode_embedding
+            return {
+                "id": data.id,
+                "model_name": data.model_name,
+                "created_at": data.created_at,
+                "embedding": decode_embedding(data.embedding, data.embedding_dtype).tolist()
+            }
+        return data
+
+
+class EmbeddingRawRead(EmbeddingMetadataRead):
+    """Schema for reading embedding data with the vector as base64 little-endian float32."""
+    embedding_b64: str
+
+    @model_validator(mode="before")
+    @classmethod
+    def encode_blob(cls, data: Any) -> Any:
+        """Base64-encode the stored blob of an ORM Embedding."""
+        if isinstance(getattr(data, "embedding", None), bytes):
+            from app.crud import embedding_to_base64
+            return {
+                "id": data.id,
+                "model_name": data.model_name,
+                "created_at": data.created_at,
+                "embedding_b64": embedding_to_base64(data.embedding, data.embedding_dtype)
+            }
+        return data
 
 
 class TimeSpentRead(BaseModel):
@@ -153,9 +182,7 @@ class TimeSpentRead(BaseModel):
     total_seconds: int
     last_updated: datetime.datetime
     
-    class Config:
-        """Pydantic configuration."""
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class HistoryRead(HistoryBase):
@@ -164,9 +191,7 @@ class HistoryRead(HistoryBase):
     page_id: int
     accessed_at: datetime.datetime
     
-    class Config:
-        """Pydantic configuration."""
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PageBasicRead(BaseModel):
@@ -178,9 +203,7 @@ class PageBasicRead(BaseModel):
     created_at: datetime.datetime
     accessed_at: Optional[datetime.datetime] = None
     
-    class Config:
-        """Pydantic configuration."""
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PageDetailRead(PageBasicRead):
@@ -195,9 +218,7 @@ class PageDetailRead(PageBasicRead):
     time_spent: Optional[TimeSpentRead] = None
     embeddings: List[EmbeddingMetadataRead] = []
     
-    class Config:
-        """Pydantic configuration."""
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PageWithEmbeddingRead(PageDetailRead):
@@ -205,6 +226,11 @@ class PageWithEmbeddingRead(PageDetailRead):
     embeddings: List[EmbeddingFullRead] = []
 
 
+class PageWithRawEmbeddingRead(PageDetailRead):
+    """Schema for page with base64-encoded embedding vectors."""
+    embeddings: List[EmbeddingRawRead] = []
+
+
 # Update schemas
 class PageUpdate(BaseModel):
     """Schema for updating page data."""
@@ -242,7 +268,20 @@ class ListPagesParams(BaseModel):
     page_type: Optional[PageType] = None
     q: Optional[str] = None
     limit: int = Field(default=20, gt=0, le=100)
-    offset: int = Field(default=0, ge=0)
+    after_id: Optional[int] = None
+
+
+# Paginated list schemas
+class PageListResponse(BaseModel):
+    """A page of list results plus the cursor for the next one."""
+    items: List[PageBasicRead]
+    next_cursor: Optional[int] = None  # Pass as after_id; None on the last page
+
+
+class HistoryListResponse(BaseModel):
+    """A page of history entries plus the cursor for the next one."""
+    items: List[HistoryRead]
+    next_cursor: Optional[int] = None  # Pass as after_id; None on the last page
 
 
 class MessageResponse(BaseModel):
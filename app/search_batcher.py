@@ -0,0 +1,95 @@
+"""
+Micro-batcher for semantic search queries.
+
+Concurrent /search/semantic requests are collected for a short window and
+sent to the in-process vector backend (FAISS, or the numpy matrix) as one
+stacked (B, d) query matrix. ``crud.semantic_search`` remains the
+single-query path for other callers.
+"""
+
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from app.config import settings
+from app.matrix_store import embedding_matrix
+from app.vector_store import faiss_index
+
+logger = logging.getLogger(__name__)
+
+
+class SearchBatcher:
+    """
+    Coalesce concurrent vector searches into batched backend calls.
+
+    Queries are collected for up to ``max_wait`` seconds or until
+    ``max_batch_size`` are queued. The batch is searched with the largest
+    requested top_k and each caller's results are trimmed to its own top_k.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait: float = 0.005):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def search(self, query_vector: List[float], top_k: int = 5) -> List[Tuple[int, float]]:
+        """Queue a query vector and wait for its (page_id, score) results."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query_vector, top_k, future))
+        return await future
+
+    async def close(self) -> None:
+        """Cancel the background worker, if running."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._queue = None
+
+    async def _collect_batch(self) -> list:
+        """Wait for the first query, then gather more until full or timed out."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            max_k = max(top_k for _, top_k, _ in batch)
+            if settings.VECTOR_SEARCH_BACKEND == "numpy":
+                search_batch = embedding_matrix.search_batch
+            else:
+                search_batch = faiss_index.search_batch
+            try:
+                # FAISS and BLAS release the GIL, so run the search off the event loop
+                results = await asyncio.to_thread(
+                    search_batch, [vector for vector, _, _ in batch], max_k
+                )
+            except Exception as e:
+                logger.error("Batched semantic search failed: %s", e)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, top_k, future), row in zip(batch, results):
+                if not future.done():
+                    future.set_result(row[:top_k])
+
+
+search_batcher = SearchBatcher()
@@ -0,0 +1,62 @@
+"""
+Query result cache for semantic search.
+
+Maps (query text, top_k) to the ranked (page_id, score) list returned by
+the vector backend, so a repeated query skips both the embedding lookup and
+the vector scan. Keys include an index version that ``invalidate`` bumps
+whenever an embedding becomes searchable; entries from older versions can
+no longer be hit and age out of the LRU.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.embedding_cache import cache_key
+
+MAX_SEARCH_CACHE_ENTRIES = 1024
+
+_results: "OrderedDict[Tuple[bytes, int, int], List[Tuple[int, float]]]" = OrderedDict()
+_version = 0
+_version_lock = threading.Lock()
+
+
+def invalidate() -> None:
+    """Make every cached result stale; called after the index gains a vector."""
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+def _key(text: str, top_k: int) -> Tuple[bytes, int, int]:
+    return cache_key(text), top_k, _version
+
+
+def get(text: str, top_k: int) -> Optional[List[Tuple[int, float]]]:
+    """Return the cached results for a query at the current index version, if any."""
+    key = _key(text, top_k)
+    results = _results.get(key)
+    if results is not None:
+        _results.move_to_end(key)
+    return results
+
+
+def current_version() -> int:
+    """Return the index version to pass to put() for a search about to start."""
+    return _version
+
+
+def put(text: str, top_k: int, version: int, results: List[Tuple[int, float]]) -> None:
+    """
+    Cache the results of a search that started at the given index version.
+
+    Results whose search started before the latest invalidation are dropped,
+    since a vector added meanwhile may be missing from them.
+    """
+    if version != _version:
+        return
+    key = (cache_key(text), top_k, version)
+    _results[key] = results
+    _results.move_to_end(key)
+    if len(_results) > MAX_SEARCH_CACHE_ENTRIES:
+        _results.popitem(last=False)
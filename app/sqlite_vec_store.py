@@ -0,0 +1,141 @@
+"""
+sqlite-vec backed vector search for the Research Board application.
+
+An alternative to the FAISS index in ``app.vector_store``, enabled with
+``VECTOR_SEARCH_BACKEND = "sqlite-vec"``. Embeddings are mirrored into a
+``vec0`` virtual table keyed by ``embeddings.id`` and searched with a KNN
+``MATCH`` query, so distance computation runs inside SQLite's native code
+and only the top_k rows reach Python. The page ID and model name are kept
+as vec0 metadata columns, so a search needs no join back to ``embeddings``
+and can be restricted to one model. While this backend is active, a
+trigger on ``embeddings`` removes the mirrored row when an embedding (or
+its page) is deleted. The trigger is dropped under any other backend,
+because without the extension loaded it would make every such DELETE
+fail with "no such module: vec0".
+"""
+
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+VEC_TABLE = "embeddings_vec"
+DIMENSION = 768
+
+
+def ensure_table(db: Session) -> None:
+    """Create the vec0 table and its delete trigger, then reconcile it with embeddings."""
+    from app.crud import EMBEDDING_STREAM_ROWS, decode_embedding
+
+    existing = db.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": VEC_TABLE}
+    ).scalar()
+    if existing is not None and "model_name" not in existing:
+        # Created before the metadata columns existed; it is only a mirror, so rebuild it
+        db.execute(text(f"DROP TABLE {VEC_TABLE}"))
+        logger.info("Recreating %s with page_id/model_name metadata columns", VEC_TABLE)
+    db.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {VEC_TABLE} USING vec0("
+        f"embedding float[{DIMENSION}] distance_metric=cosine, "
+        f"page_id integer, model_name text)"
+    ))
+    db.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {VEC_TABLE}_ad AFTER DELETE ON embeddings BEGIN "
+        f"DELETE FROM {VEC_TABLE} WHERE rowid = old.id; END"
+    ))
+    # Rows deleted while another backend was active had no trigger to fire
+    orphaned = db.execute(text(
+        f"DELETE FROM {VEC_TABLE} WHERE rowid NOT IN (SELECT id FROM embeddings)"
+    )).rowcount
+    if orphaned:
+        logger.info("Removed %d orphaned vectors from %s", orphaned, VEC_TABLE)
+    # Backfill in chunks so a first sync never holds every blob at once
+    missing = db.execute(
+        text(
+            f"SELECT id, page_id, model_name, embedding, embedding_dtype FROM embeddings "
+            f"WHERE id NOT IN (SELECT rowid FROM {VEC_TABLE})"
+        ).execution_options(yield_per=EMBEDDING_STREAM_ROWS)
+    )
+    backfilled = 0
+    for chunk in missing.partitions():
+        add_many(db, [
+            (emb_id, page_id, model_name, decode_embedding(blob, dtype))
+            for emb_id, page_id, model_name, blob, dtype in chunk
+        ])
+        backfilled += len(chunk)
+    if backfilled:
+        logger.info("Backfilled %d embeddings into %s", backfilled, VEC_TABLE)
+    db.commit()
+
+
+def drop_trigger(db: Session) -> None:
+    """
+    Remove the delete trigger left by an earlier sqlite-vec run.
+
+    The trigger's body references the vec0 table, which can't be used
+    unless the extension is loaded. That only happens for this backend.
+    ensure_table removes the orphaned vectors when the backend is
+    switched back.
+    """
+    db.execute(text(f"DROP TRIGGER IF EXISTS {VEC_TABLE}_ad"))
+    db.commit()
+
+
+def add(db: Session, embedding_id: int, page_id: int, model_name: str, vector: List[float]) -> None:
+    """Mirror a stored embedding into the vec0 table (committed with the caller's transaction)."""
+    add_many(db, [(embedding_id, page_id, model_name, vector)])
+
+
+def add_many(db: Session, items: List[Tuple[int, int, str, List[float]]]) -> None:
+    """Mirror several (embedding_id, page_id, model_name, vector) tuples with one executemany."""
+    if not items:
+        return
+    db.execute(
+        text(
+            f"INSERT INTO {VEC_TABLE}(rowid, embedding, page_id, model_name) "
+            f"VALUES (:id, :embedding, :page_id, :model_name)"
+        ),
+        [
+            {
+                "id": embedding_id,
+                "embedding": np.asarray(vector, dtype=np.float32).tobytes(),
+                "page_id": page_id,
+                "model_name": model_name
+            }
+            for embedding_id, page_id, model_name, vector in items
+        ]
+    )
+
+
+def search(
+    db: Session,
+    query_vector: List[float],
+    top_k: int = 5,
+    model_name: Optional[str] = None
+) -> List[Tuple[int, float]]:
+    """
+    Return (page_id, cosine similarity) tuples for the top_k nearest embeddings.
+
+    With model_name, only that model's embeddings are considered; the
+    filter is applied inside the KNN scan rather than after it.
+    """
+    model_filter = " AND model_name = :model_name" if model_name is not None else ""
+    rows = db.execute(
+        text(
+            f"SELECT page_id, distance FROM {VEC_TABLE} "
+            f"WHERE embedding MATCH :query AND k = :k{model_filter} "
+            f"ORDER BY distance"
+        ),
+        {
+            "query": np.asarray(query_vector, dtype=np.float32).tobytes(),
+            "k": top_k,
+            "model_name": model_name
+        }
+    ).all()
+    # vec0 reports cosine distance; convert to similarity to match the FAISS backend
+    return [(page_id, 1.0 - float(distance)) for page_id, distance in rows]
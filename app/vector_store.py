@@ -1,60 +1,318 @@
+import logging
+import threading
+
+import math
+import os
+import tempfile
+
 import faiss
 import numpy as np
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# SIMD levels a FAISS build can dispatch to, fastest first
+SIMD_LEVELS = ("AVX512_SPR", "AVX512", "AVX2", "SVE", "NEON")
+
+
+def faiss_simd_level() -> Optional[str]:
+    """Return the best SIMD level the loaded FAISS build was compiled for, if any."""
+    options = faiss.get_compile_options().split()
+    for level in SIMD_LEVELS:
+        if level in options:
+            return level
+    return None
+
+
+# Below this many vectors an exact flat scan is as fast as HNSW and exact
+HNSW_MIN_VECTORS = 1000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# IVF-PQ: OPQ rotation to 128 dims, then 32 one-byte PQ codes per vector
+IVFPQ_FACTORY = "OPQ32_128,IVF{nlist},PQ32"
+# FAISS k-means warns (and clusters poorly) below ~39 training rows per centroid
+KMEANS_MIN_ROWS_PER_CENTROID = 39
+# Training rows sampled per IVF centroid; gains little past 256
+IVFPQ_TRAIN_PER_LIST = 64
+# Each PQ sub-quantizer fits 256 centroids. The IVF list count is capped so
+# its k-means also gets enough rows (see _ivf_nlist); this is the larger of
+# the two minimums.
+IVFPQ_MIN_TRAIN_VECTORS = 256 * KMEANS_MIN_ROWS_PER_CENTROID
+
+
+def _ivf_nlist(num_vectors: int) -> int:
+    """IVF list count: ~4 * sqrt(N), capped so every centroid has enough training rows."""
+    return min(int(4 * math.sqrt(num_vectors)), num_vectors // KMEANS_MIN_ROWS_PER_CENTROID)
+
+
+def _kind_for(num_vectors: int) -> str:
+    """Index type _new_index picks for a corpus of this size: 'flat', 'hnsw' or 'ivfpq'."""
+    if num_vectors < HNSW_MIN_VECTORS:
+        return "flat"
+    if 0 < settings.FAISS_IVFPQ_MIN_VECTORS <= num_vectors and num_vectors >= IVFPQ_MIN_TRAIN_VECTORS:
+        return "ivfpq"
+    return "hnsw"
+
+
+def _index_kind(index) -> str:
+    """Classify an existing IndexIDMap-wrapped index the same way as _kind_for."""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexFlat):
+        return "flat"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "ivfpq"
+
+
+def _apply_search_params(index):
+    """Set efSearch / nprobe on the index wrapped by an IndexIDMap, whichever applies."""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+        return
+    try:
+        faiss.extract_index_ivf(inner).nprobe = settings.FAISS_NPROBE
+    except RuntimeError:  # not an IVF index
+        pass
+
 
 class FaissIndex:
     def __init__(self, dimension: int, index_path: str):
         self.dimension = dimension
         self.index_path = index_path
-        self.index = faiss.IndexFlatL2(dimension)
-        self.id_map: Dict[int, int] = {}  # faiss_id -> page_id
-        self.next_faiss_id = 0
+        self.index = self._new_index(0)
+        self.mmapped = False
+        # Writes come from request worker threads while searches run in the
+        # search batcher's thread; FAISS indexes are not safe for that mix
+        self._lock = threading.Lock()
+        # Orders concurrent saves so an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        # Vectors added while an upgrade rebuilds from a snapshot; None when idle
+        self._pending: Optional[List[Tuple[int, np.ndarray]]] = None
+
+    def _new_index(self, num_vectors: int):
+        """
+        Create an empty index suited to the corpus size.
+
+        Vectors are L2-normalized, so inner product == cosine similarity.
+        Small corpora use an exact flat scan; larger ones use an HNSW graph,
+        which visits roughly log(N) * efSearch vectors per query. With
+        FAISS_IVFPQ_MIN_VECTORS set, corpora past it use IVF-PQ over
+        ~4 * sqrt(N) lists (at most N / 39, so k-means has enough rows per
+        list), which must be trained before vectors are added.
+        Each is wrapped in an IndexIDMap whose IDs are page IDs, so search
+        results need no side table and the mapping is saved with the index
+        file.
+        """
+        kind = _kind_for(num_vectors)
+        if kind == "flat":
+            return faiss.IndexIDMap(faiss.IndexFlatIP(self.dimension))
+        if kind == "ivfpq":
+            nlist = _ivf_nlist(num_vectors)
+            index = faiss.index_factory(
+                self.dimension, IVFPQ_FACTORY.format(nlist=nlist), faiss.METRIC_INNER_PRODUCT
+            )
+            faiss.extract_index_ivf(index).nprobe = settings.FAISS_NPROBE
+            return faiss.IndexIDMap(index)
+        index = faiss.IndexHNSWFlat(self.dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return faiss.IndexIDMap(index)
+
+    def _train(self, index, matrix: np.ndarray):
+        """Train an IVF-PQ index on a random sample of the (normalized) rows."""
+        nlist = faiss.extract_index_ivf(index.index).nlist
+        sample_size = min(matrix.shape[0], max(nlist * IVFPQ_TRAIN_PER_LIST, IVFPQ_MIN_TRAIN_VECTORS))
+        rows = np.random.default_rng(0).choice(matrix.shape[0], sample_size, replace=False)
+        index.train(matrix[np.sort(rows)])
+
+    def rebuild(self, items: List[Tuple[int, List[float]]]):
+        """Replace the index contents with the given (page_id, vector) pairs."""
+        matrix = np.array([vector for _, vector in items], dtype=np.float32).reshape(-1, self.dimension)
+        page_ids = np.fromiter((page_id for page_id, _ in items), dtype=np.int64, count=len(items))
+        self.rebuild_from_matrix(page_ids, matrix)
+
+    def rebuild_from_matrix(self, page_ids: np.ndarray, matrix: np.ndarray):
+        """
+        Replace the index contents with the rows of an (N, d) float32 matrix.
+
+        The matrix is L2-normalized in place, so it must be writable.
+        """
+        index = self._build(page_ids, matrix)
+        with self._lock:
+            self.index = index
+            self.mmapped = False
+
+    def _build(self, page_ids: np.ndarray, matrix: np.ndarray):
+        """Create, train if needed and fill a new index; the live index is untouched."""
+        index = self._new_index(matrix.shape[0])
+        if matrix.shape[0]:
+            faiss.normalize_L2(matrix)
+            if not index.is_trained:
+                self._train(index, matrix)
+            index.add_with_ids(matrix, np.ascontiguousarray(page_ids, dtype=np.int64))
+        return index
+
+    def needs_rebuild(self) -> bool:
+        """True if the index type no longer matches what _new_index picks for its size."""
+        return _index_kind(self.index) != _kind_for(self.index.ntotal)
 
     def build_from_db(self, db_session):
-        """Build the FAISS index from all embeddings in the database."""
-        from app.models.models import Embedding
-        embeddings = db_session.query(Embedding.id, Embedding.page_id, Embedding.embedding).all()
-        if not embeddings:
-            return
-        vectors = []
-        for emb_id, page_id, emb_blob in embeddings:
-            vec = np.frombuffer(emb_blob, dtype=np.float32)
-            if vec.shape[0] != self.dimension:
-                continue
-            vectors.append(vec)
-            self.id_map[self.next_faiss_id] = page_id
-            self.next_faiss_id += 1
-        if vectors:
-            arr = np.stack(vectors).astype(np.float32)
-            self.index.add(arr)
+        """
+        Build the FAISS index from all embeddings in the database.
+
+        Rows are streamed in chunks into one preallocated float32 matrix, so
+        the full result set and its per-row blobs are never held at once,
+        and the matrix is added with a single add_with_ids call.
+        """
+        from app.crud import get_all_embeddings
+        page_ids, matrix = get_all_embeddings(db_session, self.dimension)
+        self.rebuild_from_matrix(page_ids, matrix)
 
     def add(self, page_id: int, vector: List[float]):
-        """Add a new vector to the index."""
+        """
+        Add a new vector to the index.
+
+        An index that starts empty is a flat scan and only grows by add().
+        When it reaches HNSW_MIN_VECTORS, or FAISS_IVFPQ_MIN_VECTORS, the
+        add that crosses the threshold rebuilds it as HNSW from its own
+        exact vectors, or starts a background thread that trains it as
+        IVF-PQ from them. Searches keep using the old index until the new
+        one is swapped in, and vectors added meanwhile are replayed into it.
+        """
         vec = np.array(vector, dtype=np.float32).reshape(1, -1)
-        self.index.add(vec)
-        self.id_map[self.next_faiss_id] = page_id
-        self.next_faiss_id += 1
+        faiss.normalize_L2(vec)
+        snapshot = None
+        with self._lock:
+            if self.mmapped:
+                # A memory-mapped index is read-only; copy it into RAM on first
+                # write. clone_index would keep viewing the mapped storage, so
+                # round-trip through serialization to get owned vectors.
+                self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+                _apply_search_params(self.index)
+                self.mmapped = False
+            self.index.add_with_ids(vec, np.array([page_id], dtype=np.int64))
+            if self._pending is not None:
+                self._pending.append((page_id, vec))
+            elif _index_kind(self.index) != "ivfpq" and self.needs_rebuild():
+                # Flat and HNSW hold exact vectors to rebuild from; PQ codes don't
+                snapshot = self._export()
+                self._pending = []
+        if snapshot is not None:
+            if _kind_for(snapshot[1].shape[0]) == "ivfpq":
+                # OPQ + IVF-PQ training can take minutes; don't hold up this insert
+                threading.Thread(target=self._upgrade, args=(*snapshot, True), daemon=True).start()
+            else:
+                self._upgrade(*snapshot)
+
+    def _export(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (page_ids, vectors) of a flat or HNSW index; call with the lock held."""
+        inner = faiss.downcast_index(self.index.index)
+        return faiss.vector_to_array(self.index.id_map).copy(), inner.reconstruct_n(0, inner.ntotal)
+
+    def _upgrade(self, page_ids: np.ndarray, matrix: np.ndarray, background: bool = False):
+        """
+        Rebuild from an exported snapshot, then swap it in with the pending adds replayed.
+
+        A background upgrade saves the index itself once swapped in, and
+        logs a failure instead of raising it; the old index stays in use.
+        """
+        logger.info("Rebuilding FAISS index for %d vectors as %s", matrix.shape[0], _kind_for(matrix.shape[0]))
+        try:
+            index = self._build(page_ids, matrix)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            if not background:
+                raise
+            logger.exception("FAISS index rebuild failed; keeping the current index")
+            return
+        with self._lock:
+            for page_id, vec in self._pending:
+                index.add_with_ids(vec, np.array([page_id], dtype=np.int64))
+            self.index = index
+            self.mmapped = False
+            self._pending = None
+        if background:
+            self.save_index()
 
     def search(self, query_vector: List[float], top_k: int = 5) -> List[Tuple[int, float]]:
-        """Search for the top_k most similar vectors. Returns (page_id, score) tuples."""
-        q = np.array(query_vector, dtype=np.float32).reshape(1, -1)
-        D, I = self.index.search(q, top_k)
-        results = []
-        for idx, dist in zip(I[0], D[0]):
-            if idx == -1:
-                continue
-            page_id = self.id_map.get(idx)
-            if page_id is not None:
-                results.append((page_id, float(dist)))
-        return results
+        """Search for the top_k most similar vectors. Returns (page_id, cosine similarity) tuples."""
+        return self.search_batch([query_vector], top_k)[0]
+
+    def search_batch(self, query_vectors, top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """
+        Search several query vectors with a single FAISS call.
+
+        Stacking B queries into one (B, d) matrix lets FAISS use a
+        matrix-matrix product instead of B separate matrix-vector products.
+        Returns one list of (page_id, cosine similarity) tuples per query.
+        """
+        q = np.array(query_vectors, dtype=np.float32).reshape(-1, self.dimension)
+        faiss.normalize_L2(q)
+        with self._lock:
+            D, I = self.index.search(q, top_k)
+        # Labels are page IDs; -1 pads rows when fewer than top_k vectors exist.
+        # Convert both result matrices in one call each rather than per row.
+        return [
+            [(page_id, dist) for page_id, dist in zip(row_ids, row_dists) if page_id != -1]
+            for row_ids, row_dists in zip(I.tolist(), D.tolist())
+        ]
 
     def save_index(self):
-        """Persist the FAISS index to disk."""
-        faiss.write_index(self.index, self.index_path)
+        """
+        Persist the FAISS index to disk.
+
+        The index is serialized under the lock, so an add running in another
+        thread can't be captured half-done, and written outside it. The bytes
+        go to a temporary file that is renamed over index_path, so a reader
+        never sees a partially written file.
+        """
+        with self._save_lock:
+            with self._lock:
+                data = faiss.serialize_index(self.index)
+            directory = os.path.dirname(self.index_path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data.tobytes())
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def load_index(self, mmap: bool = False):
+        """
+        Load the FAISS index from disk.
 
-    def load_index(self):
-        """Load the FAISS index from disk."""
-        self.index = faiss.read_index(self.index_path)
+        With mmap=True the vectors stay in the OS page cache instead of being
+        copied into process memory, so processes that map the same file
+        share those pages. save_index never rewrites the file in place (it
+        renames a new file over it), so an existing mapping stays valid. It
+        keeps serving the snapshot it was loaded from, and vectors another
+        process adds later are not visible until the index is reloaded. The
+        first add() copies the index into RAM. Falls back to a regular read
+        if this FAISS build cannot map the index.
+        """
+        self.mmapped = False
+        if mmap:
+            # IO_FLAG_MMAP_IFC maps flat/HNSW vector storage (FAISS >= 1.10)
+            mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            try:
+                self.index = faiss.read_index(self.index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+                self.mmapped = True
+            except RuntimeError:
+                self.index = faiss.read_index(self.index_path)
+        else:
+            self.index = faiss.read_index(self.index_path)
+        _apply_search_params(self.index)
 
 # Global shared FAISS index instance
-faiss_index = FaissIndex(dimension=768, index_path='data/faiss_index.bin')
+# The "_ip" suffix marks an inner-product index over normalized vectors and
+# "_ids" one whose labels are page IDs, so older index files (L2, or with
+# positional IDs that needed an in-memory map) are ignored and rebuilt.
+faiss_index = FaissIndex(dimension=768, index_path='data/faiss_index_ip_ids.bin')